@@ -0,0 +1,241 @@
+"""
+Read-only JSON API over the catalogs (/api/<resource>/), for clients that used to scrape
+the HTML listings.
+
+- Sparse fieldsets: ?fields=title,author.name selects only those columns (and joins
+  only the tables they need); the default is every field of the resource.
+- Includes: ?include=libraries adds related rows, loaded for the whole page in one
+  extra query.
+- Cursor pagination: keyset pagination (pagination.py) with ?cursor= and ?limit=;
+  the response carries next_cursor (null on the last page).
+- ETags: the ETag is derived from the request and the versions of the catalog_cache
+  scopes the resource depends on, before any query runs. A matching If-None-Match
+  gets a 304 after a single cache read, without querying the catalog.
+
+Rows are read with values(), and each resource compiles its fields into a plan that
+turns the row dicts into nested JSON objects, so no model instances are built and no
+per-object field introspection happens.
+"""
+
+from collections import defaultdict
+import hashlib
+import json
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.validators import MaxValueValidator
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+
+from . import catalog_cache
+from .pagination import InvalidCursor, KeysetPaginator
+
+
+class Resource:
+    """
+    One API resource: `fields` maps each output field ('title', 'author.name') to the
+    ORM path it is read from; `includes` maps include names to functions
+    (keys, using) -> {key: value} called with the page's primary keys.
+    """
+
+    def __init__(self, model, fields, ordering, permission, scopes, includes=None):
+        self.model = model
+        self.fields = fields
+        self.ordering = ordering
+        self.permission = permission
+        self.scopes = scopes
+        self.includes = includes or {}
+
+    def get_model(self):
+        from django.apps import apps
+        return apps.get_model(self.model)
+
+    def plan(self, names):
+        """[(key, orm path) or (key, [(subkey, orm path), ...])] in the order of `names`."""
+        plan = []
+        nested = {}
+        for name in names:
+            if '.' not in name:
+                plan.append((name, self.fields[name]))
+                continue
+            key, subkey = name.split('.', 1)
+            if key not in nested:
+                nested[key] = []
+                plan.append((key, nested[key]))
+            nested[key].append((subkey, self.fields[name]))
+        return plan
+
+
+def serialize(plan, row):
+    """One values() row as a (possibly nested) dict, following `plan`."""
+    return {
+        key: row[path] if isinstance(path, str) else {subkey: row[sub] for subkey, sub in path}
+        for key, path in plan
+    }
+
+
+async def _grouped(queryset, many=True):
+    """{first column: [rest, ...]} (or {first column: rest} when not `many`) from a values_list()."""
+    result = defaultdict(list) if many else {}
+    async for key, *rest in queryset:
+        if many:
+            result[key].append(rest)
+        else:
+            result[key] = rest
+    return result
+
+
+def _through():
+    from relationship_app.models import Library
+    return Library.books.through.objects
+
+
+async def _book_libraries(pks, using):
+    links = _through().using(using).filter(book_id__in=pks).order_by('library__name', 'library_id')
+    rows = await _grouped(links.values_list('book_id', 'library_id', 'library__name'))
+    return {pk: [{'id': id_, 'name': name} for id_, name in rows.get(pk, [])] for pk in pks}
+
+
+async def _author_books(pks, using):
+    from relationship_app.models import Book
+    books = Book.objects.using(using).filter(author_id__in=pks).order_by('title', 'pk')
+    rows = await _grouped(books.values_list('author_id', 'pk', 'title'))
+    return {pk: [{'id': id_, 'title': title} for id_, title in rows.get(pk, [])] for pk in pks}
+
+
+async def _library_books(pks, using):
+    links = _through().using(using).filter(library_id__in=pks).order_by('book__title', 'book_id')
+    rows = await _grouped(links.values_list('library_id', 'book_id', 'book__title', 'book__author__name'))
+    return {
+        pk: [{'id': id_, 'title': title, 'author': author} for id_, title, author in rows.get(pk, [])]
+        for pk in pks
+    }
+
+
+async def _library_librarian(pks, using):
+    from relationship_app.models import Librarian
+    librarians = Librarian.objects.using(using).filter(library_id__in=pks)
+    rows = await _grouped(librarians.values_list('library_id', 'pk', 'name'), many=False)
+    return {pk: {'id': rows[pk][0], 'name': rows[pk][1]} if pk in rows else None for pk in pks}
+
+
+RELATIONSHIP_SCOPES = ('relationship_app:books', 'relationship_app:libraries')
+
+RESOURCES = {
+    # relationship_app books are read from the flat CatalogEntry read model: no join.
+    'books': Resource(
+        'relationship_app.CatalogEntry',
+        {
+            'id': 'pk', 'title': 'title', 'author.id': 'author_id',
+            'author.name': 'author_name', 'author.book_count': 'author_book_count',
+        },
+        ('title', 'pk'), 'relationship_app.can_view', RELATIONSHIP_SCOPES,
+        {'libraries': _book_libraries},
+    ),
+    'authors': Resource(
+        'relationship_app.Author',
+        {'id': 'pk', 'name': 'name', 'book_count': 'book_count'},
+        ('name', 'pk'), 'relationship_app.can_view', RELATIONSHIP_SCOPES,
+        {'books': _author_books},
+    ),
+    'libraries': Resource(
+        'relationship_app.Library',
+        {'id': 'pk', 'name': 'name', 'book_count': 'book_count'},
+        ('name', 'pk'), 'relationship_app.can_view', RELATIONSHIP_SCOPES,
+        {'books': _library_books, 'librarian': _library_librarian},
+    ),
+    'librarians': Resource(
+        'relationship_app.Librarian',
+        {'id': 'pk', 'name': 'name', 'library.id': 'library_id', 'library.name': 'library__name'},
+        ('name', 'pk'), 'relationship_app.can_view', RELATIONSHIP_SCOPES,
+    ),
+    'bookshelf/books': Resource(
+        'bookshelf.Book',
+        {'id': 'pk', 'title': 'title', 'author': 'author', 'publication_year': 'publication_year'},
+        ('title', 'pk'), 'bookshelf.can_view', ('bookshelf:books',),
+    ),
+}
+
+
+class ApiQueryForm(forms.Form):
+    """Validates the query parameters (?fields=&include=&cursor=&limit=)."""
+
+    fields = forms.CharField(required=False)
+    include = forms.CharField(required=False)
+    cursor = forms.CharField(required=False)
+    limit = forms.IntegerField(required=False, min_value=1)
+
+    def __init__(self, resource, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.resource = resource
+        limit = self.fields['limit']
+        limit.max_value = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+        limit.validators.append(MaxValueValidator(limit.max_value))
+
+    def _names(self, field, allowed):
+        names = [name.strip() for name in self.cleaned_data[field].split(',') if name.strip()]
+        unknown = sorted(set(names) - set(allowed))
+        if unknown:
+            raise forms.ValidationError('Unknown %s: %s.' % (field, ', '.join(unknown)))
+        return list(dict.fromkeys(names))
+
+    def clean_fields(self):
+        return self._names('fields', self.resource.fields) or list(self.resource.fields)
+
+    def clean_include(self):
+        return self._names('include', self.resource.includes)
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+async def api_view(request, resource):
+    """GET /api/<resource>/: one page of the resource as JSON; see the module docstring."""
+    spec = RESOURCES.get(resource)
+    if spec is None:
+        return _error('Unknown resource.', status=404)
+    if request.method not in ('GET', 'HEAD'):
+        return _error('Method not allowed.', status=405)
+    user = await request.auser()
+    if not await user.ahas_perm(spec.permission):
+        raise PermissionDenied
+
+    versions = await catalog_cache.aversions(spec.scopes)
+    raw = repr((resource, sorted(request.GET.lists()), versions))
+    etag = '"%s"' % hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    form = ApiQueryForm(spec, request.GET)
+    if not form.is_valid():
+        return _error(' '.join(error for errors in form.errors.values() for error in errors))
+    names, includes = form.cleaned_data['fields'], form.cleaned_data['include']
+    plan = spec.plan(names)
+    paths = {spec.fields[name] for name in names} | {field.lstrip('-') for field in spec.ordering}
+    paginator = KeysetPaginator(
+        spec.get_model().objects.values(*paths), spec.ordering,
+        form.cleaned_data['limit'] or getattr(settings, 'CATALOG_PAGE_SIZE', 50), request.path,
+    )
+    try:
+        page = await paginator.apage(form.cleaned_data['cursor'])
+    except InvalidCursor as e:
+        return _error(str(e))
+
+    results = [serialize(plan, row) for row in page]
+    if includes:
+        pks = [row['pk'] for row in page]
+        using = paginator.queryset.db
+        for name in includes:
+            related = await spec.includes[name](pks, using)
+            for row, pk in zip(results, pks):
+                row[name] = related[pk]
+
+    content = json.dumps({'results': results, 'next_cursor': page.next_cursor}, separators=(',', ':'))
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    # Clients may keep the page but must revalidate it; it is never shared between users.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,38 @@
+"""
+Timing and database helpers shared by the benchmark_* management commands.
+"""
+
+from contextlib import contextmanager
+import time
+
+from django.db import transaction
+
+
+@contextmanager
+def rolled_back(using=None):
+    """Run the block in a transaction that is rolled back at the end, so generated rows are not kept."""
+    with transaction.atomic(using=using):
+        yield
+        transaction.set_rollback(True, using=using)
+
+
+def best_of(run, repeat, warmup=False):
+    """Call `run()` `repeat` times and return the fastest call in milliseconds."""
+    if warmup:
+        run()
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def mean_of(run, calls, warmup=False):
+    """Call `run()` `calls` times in a loop and return the mean time per call in microseconds."""
+    if warmup:
+        run()
+    started = time.perf_counter()
+    for _ in range(calls):
+        run()
+    return (time.perf_counter() - started) / calls * 1e6
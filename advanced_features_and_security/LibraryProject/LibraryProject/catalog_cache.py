@@ -0,0 +1,124 @@
+"""
+Page caching for the (async) catalog views, invalidated by change signals.
+
+Each cached page depends on one or more version "scopes", e.g. 'relationship_app:books'
+or 'relationship_app:library:3'. The current version of every scope is part of the
+cache key, so bumping a scope (from post_save/post_delete/m2m_changed receivers in the
+apps' models.py) makes every page that depends on it miss on its next request after
+the change is committed. Expired
+entries simply age out; CATALOG_CACHE_TIMEOUT is only a backstop.
+
+Keys also include the user's permission set, the view arguments and the query string
+(with ?query= normalized), so different permission sets and searches never share an
+entry. Hits and misses are counted per view name (see stats()).
+
+Misses render from the primary database (routers.primary_reads()): the versions come
+from commits on the primary, and a lagging replica would store the old rows under
+the new version until the next change.
+"""
+
+from collections import Counter
+from functools import wraps
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from . import metrics, routers
+
+_stats = Counter()
+
+
+def _version_key(scope):
+    return 'catalog:version:%s' % scope
+
+
+def bump(*scopes):
+    """
+    Invalidate every cached page that depends on any of `scopes`, once the current
+    transaction commits (at once outside a transaction). Bumping before the commit
+    would let a concurrent request cache the old rows under the new version.
+    """
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _bump(scopes):
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            # No version stored yet: nothing cached under this scope can be current.
+            pass
+
+
+async def aversions(scopes):
+    """Current versions of `scopes`, e.g. to derive ETags from."""
+    keys = [_version_key(scope) for scope in scopes]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Seed from the clock, so a lost version key never reuses an older version.
+            await cache.aadd(key, int(time.time()), None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a search query, for cache keys."""
+    return ' '.join(query.split()).casefold()
+
+
+def _params_key(request):
+    params = []
+    for name, value in sorted(request.GET.lists()):
+        if name == 'query':
+            value = [normalize_query(v) for v in value]
+        params.append((name, value))
+    return repr(params)
+
+
+def cached_catalog_page(name, scopes):
+    """
+    Cache an async view's 200 responses. `scopes(request, *args, **kwargs)` returns the
+    version scopes the page depends on. Apply it inside permission_required, so access
+    is checked before the cache is read. Not for views that use @csp_nonce.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        async def _wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view_func(request, *args, **kwargs)
+            user = await request.auser()
+            perms = ','.join(sorted(await user.aget_all_permissions()))
+            page_scopes = scopes(request, *args, **kwargs)
+            versions = await aversions(page_scopes)
+            raw = repr((name, args, sorted(kwargs.items()), _params_key(request), perms, versions))
+            key = 'catalog:page:%s:%s' % (name, hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+            cached = await cache.aget(key)
+            metrics.record_cache(cached is not None)
+            if cached is not None:
+                _stats[name, 'hit'] += 1
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            _stats[name, 'miss'] += 1
+            with routers.primary_reads():
+                response = await view_func(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+                await cache.aset(key, (response.content, response['Content-Type']), timeout)
+            return response
+        return _wrapper
+    return decorator
+
+
+def stats():
+    """Per-process hit/miss counters: {view name: {'hit': n, 'miss': n}}."""
+    result = {}
+    for (name, outcome), count in _stats.items():
+        result.setdefault(name, {'hit': 0, 'miss': 0})[outcome] = count
+    return result
@@ -0,0 +1,58 @@
+"""
+Database connection setup for the profiles in settings.py (DJANGO_DB_PROFILE).
+
+- SQLite connections get SQLITE_PRAGMAS when they are opened (connection_created):
+  WAL lets readers run while a write commits, synchronous=NORMAL drops the fsync per
+  commit (still safe in WAL mode; a power loss can only lose the last commits),
+  mmap_size reads pages through memory mapping and busy_timeout makes writers wait
+  for the lock instead of failing with "database is locked".
+- PostgreSQL uses either psycopg's connection pool or persistent connections
+  (CONN_MAX_AGE with CONN_HEALTH_CHECKS); nothing is needed per connection.
+
+stats() reports, per database alias, how connections are handled and the pool counters.
+The receiver is connected by RelationshipAppConfig.ready().
+"""
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply SQLITE_PRAGMAS to each new SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+def _pragma(cursor, name):
+    # Some PRAGMAs return no row in some cases (e.g. mmap_size on an in-memory database).
+    row = cursor.execute('PRAGMA %s' % name).fetchone()
+    return row[0] if row else None
+
+
+def stats():
+    """{alias: connection handling, pool counters (PostgreSQL pool) or PRAGMA values (SQLite)}."""
+    result = {}
+    for alias in connections:
+        connection = connections[alias]
+        info = {
+            'vendor': connection.vendor,
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+            'connected': connection.connection is not None,
+        }
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            info['pool'] = pool.get_stats()
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                info['pragmas'] = {
+                    name: _pragma(cursor, name) for name in getattr(settings, 'SQLITE_PRAGMAS', {})
+                }
+        result[alias] = info
+    return result
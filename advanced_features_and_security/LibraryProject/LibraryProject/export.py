@@ -0,0 +1,114 @@
+"""
+Streaming catalog export (CSV / JSONL, optionally gzip-compressed).
+
+Rows are read with QuerySet.iterator(chunk_size=...) and encoded one at a time, so
+memory stays constant however large the catalog is. Used by the export views in
+relationship_app and bookshelf and by the export_catalog management command.
+"""
+
+import csv
+import json
+import zlib
+
+from django import forms
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+CHUNK_SIZE = 2000
+
+
+class ExportForm(forms.Form):
+    """Validates export query parameters (?format=csv|jsonl&compress=gzip)."""
+
+    format = forms.ChoiceField(choices=[(f, f) for f in FORMATS], required=False)
+    compress = forms.ChoiceField(choices=[('gzip', 'gzip')], required=False)
+
+
+def relationship_app_rows(chunk_size=CHUNK_SIZE):
+    """relationship_app books with author and library names; one libraries query per chunk."""
+    from relationship_app.models import Book
+
+    books = Book.objects.with_author().prefetch_related('libraries').order_by('pk')
+    for book in books.iterator(chunk_size=chunk_size):
+        yield {
+            'id': book.pk,
+            'title': book.title,
+            'author_id': book.author_id,
+            'author': book.author.name,
+            'libraries': [library.name for library in book.libraries.all()],
+        }
+
+
+def bookshelf_rows(chunk_size=CHUNK_SIZE):
+    """bookshelf books as plain values; no model instances are built."""
+    from bookshelf.models import Book
+
+    books = Book.objects.order_by('pk').values('id', 'title', 'author', 'publication_year')
+    return books.iterator(chunk_size=chunk_size)
+
+
+# catalog name -> (field names, row generator)
+CATALOGS = {
+    'relationship_app': (('id', 'title', 'author_id', 'author', 'libraries'), relationship_app_rows),
+    'bookshelf': (('id', 'title', 'author', 'publication_year'), bookshelf_rows),
+}
+
+
+class _Echo:
+    """File-like object whose write() returns the value, so csv.writer yields strings."""
+
+    def write(self, value):
+        return value
+
+
+def encode_rows(rows, fieldnames, fmt):
+    """Yield each row encoded as one UTF-8 line; CSV list values are joined with '|'."""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fieldnames).encode()
+        for row in rows:
+            values = [row[name] for name in fieldnames]
+            values = ['|'.join(v) if isinstance(v, list) else v for v in values]
+            yield writer.writerow(values).encode()
+    else:
+        for row in rows:
+            yield (json.dumps(row, ensure_ascii=False) + '\n').encode()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a byte stream into gzip format on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(catalog, fmt='csv', compress=False, chunk_size=CHUNK_SIZE):
+    """Return an iterator of bytes for the whole catalog in the requested format."""
+    fieldnames, rows = CATALOGS[catalog]
+    chunks = encode_rows(rows(chunk_size), fieldnames, fmt)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_response(request, catalog):
+    """StreamingHttpResponse for an export view; options come from ExportForm."""
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest('Invalid export options.')
+    fmt = form.cleaned_data.get('format') or 'csv'
+    compress = form.cleaned_data.get('compress') == 'gzip'
+    filename = '%s.%s' % (catalog, fmt)
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    else:
+        content_type = CONTENT_TYPES[fmt]
+    response = StreamingHttpResponse(export_stream(catalog, fmt, compress), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
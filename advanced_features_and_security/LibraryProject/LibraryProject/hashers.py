@@ -0,0 +1,106 @@
+"""
+Password hashers whose cost comes from the active PASSWORD_HASH_PROFILE (settings.py).
+
+Each hasher keeps Django's algorithm name, so existing hashes still verify. When a
+profile's cost parameters change, Django's check_password sees must_update() and
+rehashes the password with the new parameters on the user's next successful login;
+when the profile switches algorithm, the preferred (first) hasher changes and old
+hashes are upgraded the same way.
+"""
+
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher,
+)
+
+
+def _cost(hasher, name, default):
+    """A cost parameter from the active profile, if the profile uses this hasher."""
+    profile = settings.PASSWORD_HASH_PROFILES[settings.PASSWORD_HASH_PROFILE]
+    if profile['hasher'] != hasher:
+        return default
+    return profile.get(name, default)
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    profile_hasher = 'pbkdf2'
+
+    @property
+    def iterations(self):
+        return _cost('pbkdf2', 'iterations', PBKDF2PasswordHasher.iterations)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Requires the optional argon2-cffi package."""
+
+    profile_hasher = 'argon2'
+
+    @property
+    def time_cost(self):
+        return _cost('argon2', 'time_cost', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return _cost('argon2', 'memory_cost', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return _cost('argon2', 'parallelism', Argon2PasswordHasher.parallelism)
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    profile_hasher = 'scrypt'
+
+    @property
+    def work_factor(self):
+        return _cost('scrypt', 'work_factor', ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return _cost('scrypt', 'block_size', ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return _cost('scrypt', 'parallelism', ScryptPasswordHasher.parallelism)
+
+    @staticmethod
+    def limits():
+        """
+        (max N * r, max p) a hash may use: the largest of Django's default and the
+        PASSWORD_HASH_PROFILES scrypt costs, so hashes from any configured profile verify.
+        """
+        costs = [(ScryptPasswordHasher.work_factor, ScryptPasswordHasher.block_size, ScryptPasswordHasher.parallelism)]
+        costs += [
+            (profile.get('work_factor', costs[0][0]), profile.get('block_size', costs[0][1]),
+             profile.get('parallelism', costs[0][2]))
+            for profile in settings.PASSWORD_HASH_PROFILES.values() if profile['hasher'] == 'scrypt'
+        ]
+        return max(n * r for n, r, _ in costs), max(p for _, _, p in costs)
+
+    def verify(self, password, encoded):
+        # The stored parameters size the work, so a crafted or corrupted hash could make a
+        # login allocate any amount of memory: refuse hashes above the configured costs.
+        decoded = self.decode(encoded)
+        max_nr, max_p = self.limits()
+        if decoded['work_factor'] * decoded['block_size'] > max_nr or decoded['parallelism'] > max_p:
+            return False
+        return super().verify(password, encoded)
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        # As ScryptPasswordHasher.encode(), but with a memory limit for the N and r in
+        # use: verify() passes the stored hash's own values, which may exceed the
+        # profile's. scrypt needs 128 * N * r bytes; OpenSSL's default limit (32 MiB)
+        # is too low above N=2**14. N * r is capped by limits().
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+            maxmem=2 * 128 * min(n * r, self.limits()[0]), dklen=64,
+        )
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
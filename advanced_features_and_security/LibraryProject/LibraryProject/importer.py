@@ -0,0 +1,240 @@
+"""
+Bulk catalog import (CSV / JSONL, optionally gzip-compressed), the counterpart of export.py.
+
+Rows are streamed from the file and written in batches with bulk_create, one
+transaction per batch. Author and library names are resolved through in-memory
+name -> id maps, so each name costs at most one INSERT for the whole import.
+Books are upserted by natural key, so re-running an import does not duplicate rows:
+- relationship_app: (title, author name); library links are added if missing.
+- bookshelf: (title, author); publication_year is updated when it changed.
+"""
+
+import csv
+import gzip
+import io
+import json
+import time
+from itertools import islice
+
+from django.db import transaction
+
+from . import catalog_cache, changes, routers
+from .export import FORMATS
+
+BATCH_SIZE = 1000
+
+
+def open_rows(path, fmt=None):
+    """Yield dict rows from a .csv/.jsonl file (gzip if the name ends in .gz)."""
+    name = path[:-3] if path.endswith('.gz') else path
+    if fmt is None:
+        fmt = 'jsonl' if name.endswith(('.jsonl', '.ndjson')) else 'csv'
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format: %s' % fmt)
+    raw = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+    with io.TextIOWrapper(raw, encoding='utf-8', newline='') as stream:
+        if fmt == 'csv':
+            yield from csv.DictReader(stream)
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _resolve_names(model, names, known):
+    """Add ids for `names` to the `known` name -> id map, creating missing rows in one INSERT."""
+    missing = sorted(set(names) - known.keys())
+    if missing:
+        for obj in model.objects.bulk_create([model(name=name) for name in missing]):
+            known[obj.name] = obj.pk
+
+
+def _clean(value, max_length):
+    value = (value or '').strip() if isinstance(value, str) else value
+    if not value or (max_length and len(str(value)) > max_length):
+        return None
+    return value
+
+
+class ImportStats:
+    """Counters for one import run; rate is rows read per second."""
+
+    def __init__(self):
+        self.rows = self.created = self.updated = self.skipped = 0
+        self.started = time.monotonic()
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.rows / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return '%d rows (%d created, %d updated, %d skipped) at %.0f rows/s' % (
+            self.rows, self.created, self.updated, self.skipped, self.rate
+        )
+
+
+class RelationshipAppImporter:
+    """Import relationship_app books with author and library names."""
+
+    def __init__(self):
+        from relationship_app.models import Author, Book, Library
+
+        self.Author, self.Book, self.Library = Author, Book, Library
+        self.title_length = Book._meta.get_field('title').max_length
+        self.author_length = Author._meta.get_field('name').max_length
+        self.library_length = Library._meta.get_field('name').max_length
+        self.authors = dict(Author.objects.values_list('name', 'pk'))
+        self.libraries = dict(Library.objects.values_list('name', 'pk'))
+
+    def parse(self, row, stats):
+        title = _clean(row.get('title'), self.title_length)
+        author = _clean(row.get('author'), self.author_length)
+        libraries = row.get('libraries') or []
+        if isinstance(libraries, str):
+            libraries = libraries.split('|')
+        libraries = [name for name in (_clean(n, self.library_length) for n in libraries) if name]
+        if title is None or author is None:
+            stats.skipped += 1
+            return None
+        return title, author, libraries
+
+    def import_batch(self, rows, stats):
+        _resolve_names(self.Author, [author for _, author, _ in rows], self.authors)
+        _resolve_names(self.Library, [name for _, _, names in rows for name in names], self.libraries)
+
+        keys = {(title, self.authors[author]) for title, author, _ in rows}
+        books = {
+            (title, author_id): pk
+            for pk, title, author_id in self.Book.objects.filter(
+                title__in={title for title, _ in keys}
+            ).values_list('pk', 'title', 'author_id')
+            if (title, author_id) in keys
+        }
+        new = [self.Book(title=title, author_id=author_id) for title, author_id in keys - books.keys()]
+        for book in self.Book.objects.bulk_create(new):
+            books[(book.title, book.author_id)] = book.pk
+        stats.created += len(new)
+
+        Through = self.Library.books.through
+        links = {
+            (self.libraries[name], books[(title, self.authors[author])])
+            for title, author, names in rows
+            for name in names
+        }
+        links -= set(Through.objects.filter(
+            library_id__in={library_id for library_id, _ in links},
+            book_id__in={book_id for _, book_id in links},
+        ).values_list('library_id', 'book_id'))
+        # The through table is unique on (library, book): a link added concurrently is skipped.
+        Through.objects.bulk_create(
+            [Through(library_id=library_id, book_id=book_id) for library_id, book_id in links],
+            ignore_conflicts=True,
+        )
+        self.refresh(new, {library_id for library_id, _ in links})
+
+    def refresh(self, new_books, library_ids):
+        """
+        bulk_create sends no signals: bring the denormalized counts and read models of
+        the authors, books and libraries this batch touched up to date.
+        """
+        from relationship_app import snapshots
+
+        author_ids = {book.author_id for book in new_books}
+        self.Author.objects.filter(pk__in=author_ids).recount()
+        self.Library.objects.filter(pk__in=library_ids).recount()
+        snapshots.add_entries([book.pk for book in new_books])
+        snapshots.refresh_entry_counts(author_ids)
+        snapshots.mark_stale(library_ids)
+
+
+class BookshelfImporter:
+    """Import bookshelf books (title, author, publication_year)."""
+
+    def __init__(self):
+        from bookshelf.models import Book
+
+        self.Book = Book
+        self.title_length = Book._meta.get_field('title').max_length
+        self.author_length = Book._meta.get_field('author').max_length
+
+    def parse(self, row, stats):
+        title = _clean(row.get('title'), self.title_length)
+        author = _clean(row.get('author'), self.author_length)
+        try:
+            year = int(row.get('publication_year'))
+        except (TypeError, ValueError):
+            year = None
+        if title is None or author is None or year is None:
+            stats.skipped += 1
+            return None
+        return title, author, year
+
+    def import_batch(self, rows, stats):
+        years = {(title, author): year for title, author, year in rows}
+        existing = {
+            (book.title, book.author): book
+            for book in self.Book.objects.filter(title__in={title for title, _ in years})
+            .only('pk', 'title', 'author', 'publication_year')
+            if (book.title, book.author) in years
+        }
+        changed = []
+        for key, book in existing.items():
+            if book.publication_year != years[key]:
+                book.publication_year = years[key]
+                changed.append(book)
+        self.Book.objects.bulk_update(changed, ['publication_year'])
+        new = [
+            self.Book(title=title, author=author, publication_year=year)
+            for (title, author), year in years.items()
+            if (title, author) not in existing
+        ]
+        self.Book.objects.bulk_create(new)
+        stats.created += len(new)
+        stats.updated += len(changed)
+
+
+IMPORTERS = {
+    'relationship_app': RelationshipAppImporter,
+    'bookshelf': BookshelfImporter,
+}
+
+# bulk_create/bulk_update send no signals, so cached pages and change times are updated explicitly.
+CACHE_SCOPES = {
+    'relationship_app': ('relationship_app:books', 'relationship_app:libraries'),
+    'bookshelf': ('bookshelf:books',),
+}
+CHANGED_MODELS = {
+    'relationship_app': ('relationship_app.author', 'relationship_app.book', 'relationship_app.library'),
+    'bookshelf': ('bookshelf.book',),
+}
+
+
+def import_catalog(catalog, rows, batch_size=BATCH_SIZE, progress=None):
+    """
+    Import an iterable of dict rows into `catalog`, one transaction per batch.
+    `progress(stats)` is called after each batch. Returns the final ImportStats.
+    Reads go to the primary: the natural-key lookups must see the rows just written.
+    """
+    with routers.pin_to_primary():
+        importer = IMPORTERS[catalog]()
+        stats = ImportStats()
+        for batch in batched(rows, batch_size):
+            stats.rows += len(batch)
+            parsed = [p for p in (importer.parse(row, stats) for row in batch) if p is not None]
+            with transaction.atomic():
+                importer.import_batch(parsed, stats)
+            if progress:
+                progress(stats)
+    catalog_cache.bump(*CACHE_SCOPES[catalog])
+    changes.touch(*CHANGED_MODELS[catalog])
+    return stats
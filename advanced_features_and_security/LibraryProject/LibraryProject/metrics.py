@@ -0,0 +1,224 @@
+"""
+Per-request performance metrics (PerformanceMiddleware in middleware.py).
+
+For a sampled request (METRICS_SAMPLE_RATE) the middleware starts a RequestMetrics in a
+context variable; the context follows the request into sync_to_async threads, so:
+- every database query is timed by an execute wrapper installed on each connection
+  (connection_created), which does nothing when no request is being measured;
+- template rendering is timed by the TimedDjangoTemplates backend (TEMPLATES in settings.py);
+- catalog page cache hits and misses are reported by catalog_cache.
+
+Finished requests are aggregated per view name into in-process counters and a duration
+histogram, served in the Prometheus text format by metrics_view (/metrics) together
+with any gauges registered by the apps (register_gauge). Each worker
+process has its own numbers; scrape every worker, or run one per host and sum.
+"""
+
+from contextvars import ContextVar
+import hmac
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates
+
+# Upper bounds (seconds) of the request duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Timings and counters for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def server_timing(self, total):
+        """Server-Timing header value (durations in milliseconds)."""
+        return 'db;dur=%.1f;desc="%d queries", tpl;dur=%.1f, cache;desc="%d hit %d miss", total;dur=%.1f' % (
+            self.db_time * 1000, self.queries, self.template_time * 1000,
+            self.cache_hits, self.cache_misses, total * 1000,
+        )
+
+
+def start():
+    """Start measuring the current request; returns (metrics, token for finish())."""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def record_cache(hit):
+    """Count a cache hit or miss for the request being measured, if any."""
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+def time_query(execute, sql, params, many, context):
+    """connection.execute_wrapper that times queries of measured requests."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def install_query_wrapper(connection):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    install_query_wrapper(connection)
+
+
+def instrument_open_connections():
+    """Instrument connections of this thread opened before this module was imported."""
+    for connection in connections.all(initialized_only=True):
+        install_query_wrapper(connection)
+
+
+class TimedTemplate:
+    """Wraps a DjangoTemplates template to add its render time to the current request."""
+
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose templates report their render time to RequestMetrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+# Aggregates per view name: {view: {'count', 'duration', 'buckets', 'queries', ...}}.
+_aggregates = {}
+_lock = threading.Lock()
+
+
+def observe(view, metrics, duration):
+    """Add a finished request to the per-view aggregates."""
+    with _lock:
+        agg = _aggregates.get(view)
+        if agg is None:
+            agg = _aggregates[view] = {
+                'count': 0, 'duration': 0.0, 'buckets': [0] * len(DURATION_BUCKETS),
+                'queries': 0, 'db_time': 0.0, 'template_time': 0.0,
+                'cache_hits': 0, 'cache_misses': 0,
+            }
+        agg['count'] += 1
+        agg['duration'] += duration
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                agg['buckets'][i] += 1
+        agg['queries'] += metrics.queries
+        agg['db_time'] += metrics.db_time
+        agg['template_time'] += metrics.template_time
+        agg['cache_hits'] += metrics.cache_hits
+        agg['cache_misses'] += metrics.cache_misses
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# (metric name, help, aggregate key) for the per-view counters.
+COUNTERS = (
+    ('django_request_db_queries_total', 'Database queries run by sampled requests.', 'queries'),
+    ('django_request_db_seconds_total', 'Time spent in database queries.', 'db_time'),
+    ('django_request_template_seconds_total', 'Time spent rendering templates.', 'template_time'),
+    ('django_request_cache_hits_total', 'Catalog page cache hits.', 'cache_hits'),
+    ('django_request_cache_misses_total', 'Catalog page cache misses.', 'cache_misses'),
+)
+
+
+# (metric name, help, function returning the current value), read on each scrape.
+_gauges = []
+
+
+def register_gauge(name, help_text, value):
+    """Expose `value()` as a gauge at /metrics (e.g. from an AppConfig.ready())."""
+    _gauges.append((name, help_text, value))
+
+
+def render_prometheus():
+    """The aggregates and gauges in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        snapshot = {view: dict(agg, buckets=list(agg['buckets'])) for view, agg in _aggregates.items()}
+    lines = [
+        '# HELP django_request_duration_seconds Wall time of sampled requests.',
+        '# TYPE django_request_duration_seconds histogram',
+    ]
+    for view, agg in sorted(snapshot.items()):
+        label = _label(view)
+        for bound, count in zip(DURATION_BUCKETS, agg['buckets']):
+            lines.append('django_request_duration_seconds_bucket{view="%s",le="%s"} %d' % (label, bound, count))
+        lines.append('django_request_duration_seconds_bucket{view="%s",le="+Inf"} %d' % (label, agg['count']))
+        lines.append('django_request_duration_seconds_sum{view="%s"} %.6f' % (label, agg['duration']))
+        lines.append('django_request_duration_seconds_count{view="%s"} %d' % (label, agg['count']))
+    for name, help_text, key in COUNTERS:
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s counter' % name)
+        for view, agg in sorted(snapshot.items()):
+            lines.append('%s{view="%s"} %s' % (name, _label(view), agg[key]))
+    for name, help_text, value in _gauges:
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s gauge' % name)
+        lines.append('%s %s' % (name, value()))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. With METRICS_TOKEN set, requires "Authorization: Bearer
+    <token>"; otherwise only staff users may read it.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer %s' % token)
+    else:
+        allowed = request.user.is_active and request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
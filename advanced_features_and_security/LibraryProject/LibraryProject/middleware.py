@@ -1,39 +1,336 @@
 """
-Security middleware: X-XSS-Protection and Content-Security-Policy headers.
-Reduces XSS risk by enabling browser XSS filter and restricting script/style sources.
+Project middleware:
+- SecurityHeadersMiddleware: X-XSS-Protection and Content-Security-Policy headers,
+  which reduce XSS risk by enabling the browser XSS filter and restricting
+  script/style sources;
+- ReplicaPinningMiddleware: keeps reads on the primary after a write (see routers.py);
+- PerformanceMiddleware: measures requests (see metrics.py);
+- QueryInspectionMiddleware: reports N+1 and slow queries (see querycheck.py).
+
+The security headers are compiled from settings once, at startup, and recompiled only when
+a relevant setting changes (setting_changed, e.g. override_settings in tests), so a
+response costs a few dict assignments. Views can adjust the policy with @csp_override
+or add a per-response nonce with @csp_nonce; each distinct override is compiled once.
 """
 
-from django.utils.deprecation import MiddlewareMixin
+from functools import wraps
+import random
+import secrets
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from . import metrics, querycheck, routers
+
+# (directive, setting) in header order.
+CSP_DIRECTIVES = (
+    ('default-src', 'CSP_DEFAULT_SRC'),
+    ('script-src', 'CSP_SCRIPT_SRC'),
+    ('style-src', 'CSP_STYLE_SRC'),
+    ('img-src', 'CSP_IMG_SRC'),
+    ('font-src', 'CSP_FONT_SRC'),
+    ('connect-src', 'CSP_CONNECT_SRC'),
+    ('frame-ancestors', 'CSP_FRAME_ANCESTORS'),
+)
+# Directives that receive the 'nonce-...' source from @csp_nonce.
+CSP_NONCE_DIRECTIVES = ('script-src', 'style-src')
+
+# Compiled policies keyed by override (None = the settings policy); cleared on setting_changed.
+_policies = {}
+_xss_header = None
+
+
+def _directive_sources(overrides):
+    """Map directive -> sources from CSP_* settings, with per-view overrides applied."""
+    sources = {}
+    for directive, setting in CSP_DIRECTIVES:
+        if hasattr(settings, setting):
+            sources[directive] = tuple(getattr(settings, setting))
+    for directive, value in overrides or ():
+        if value is None:
+            sources.pop(directive, None)
+        else:
+            sources[directive] = tuple(value)
+    return sources
+
+
+class CompiledPolicy:
+    """A Content-Security-Policy header value, plus a template for adding a nonce."""
+
+    def __init__(self, overrides=None):
+        sources = _directive_sources(overrides)
+        self.header = '; '.join(' '.join((d,) + s) for d, s in sources.items()) or None
+        # A missing script-src/style-src falls back to default-src in the browser; with a
+        # nonce it must be spelled out, or the nonce would have no directive to go in.
+        if 'default-src' in sources:
+            for directive in CSP_NONCE_DIRECTIVES:
+                sources.setdefault(directive, sources['default-src'])
+        # '%' in sources is escaped so the template only has the nonce placeholder.
+        self.nonce_template = '; '.join(
+            ' '.join((d,) + tuple(v.replace('%', '%%') for v in s)
+                     + (("'nonce-%(nonce)s'",) if d in CSP_NONCE_DIRECTIVES else ()))
+            for d, s in sources.items()
+        ) or None
+
+    def with_nonce(self, nonce):
+        if self.nonce_template is None:
+            return None
+        return self.nonce_template % {'nonce': nonce}
+
+
+def get_policy(overrides=None):
+    """Return the CompiledPolicy for an override key (a tuple of (directive, sources) pairs)."""
+    policy = _policies.get(overrides)
+    if policy is None:
+        policy = _policies[overrides] = CompiledPolicy(overrides)
+    return policy
+
+
+def get_xss_header():
+    global _xss_header
+    if _xss_header is None:
+        _xss_header = '1; mode=block' if getattr(settings, 'SECURE_BROWSER_XSS_FILTER', False) else ''
+    return _xss_header
+
+
+@receiver(setting_changed)
+def reset_security_headers(setting, **kwargs):
+    """Recompile the headers when a CSP_* or XSS setting changes."""
+    global _xss_header
+    if setting.startswith('CSP_') or setting == 'SECURE_BROWSER_XSS_FILTER':
+        _policies.clear()
+        _xss_header = None
+
 
+def _decorate(view_func, before, after):
+    """Wrap a sync or async view: state = before(request), then after(response, state)."""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapper(request, *args, **kwargs):
+            state = before(request)
+            response = await view_func(request, *args, **kwargs)
+            after(response, state)
+            return response
+    else:
+        @wraps(view_func)
+        def _wrapper(request, *args, **kwargs):
+            state = before(request)
+            response = view_func(request, *args, **kwargs)
+            after(response, state)
+            return response
+    return _wrapper
 
-class SecurityHeadersMiddleware(MiddlewareMixin):
+
+def csp_override(**directives):
+    """
+    Replace CSP directives for one view, e.g. @csp_override(img_src=("'self'", 'https://covers.example')).
+    Keyword names use '_' for '-'; pass None to drop a directive.
+    """
+    overrides = tuple(sorted(
+        (name.replace('_', '-'), None if value is None else tuple(value))
+        for name, value in directives.items()
+    ))
+
+    def after(response, state):
+        response._csp_overrides = overrides
+
+    def decorator(view_func):
+        return _decorate(view_func, lambda request: None, after)
+    return decorator
+
+
+def csp_nonce(view_func):
+    """
+    Generate a per-request nonce as request.csp_nonce (use it as nonce="{{ request.csp_nonce }}"
+    on inline <script>/<style>) and add it to script-src/style-src for this response.
+    """
+    def before(request):
+        request.csp_nonce = secrets.token_urlsafe(16)
+        return request.csp_nonce
+
+    def after(response, nonce):
+        response._csp_nonce = nonce
+
+    return _decorate(view_func, before, after)
+
+
+class SecurityHeadersMiddleware:
     """
     Add security-related response headers:
     - X-XSS-Protection (when SECURE_BROWSER_XSS_FILTER is True)
     - Content-Security-Policy from CSP_* settings
+    Works in both WSGI (sync) and ASGI (async) middleware chains.
     """
 
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Compile the default headers at startup rather than on the first response.
+        get_xss_header()
+        get_policy()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
     def process_response(self, request, response):
-        if getattr(settings, 'SECURE_BROWSER_XSS_FILTER', False):
-            response['X-XSS-Protection'] = '1; mode=block'
-
-        # Build Content-Security-Policy header from settings to reduce XSS risk.
-        csp_parts = []
-        if hasattr(settings, 'CSP_DEFAULT_SRC'):
-            csp_parts.append("default-src " + " ".join(settings.CSP_DEFAULT_SRC))
-        if hasattr(settings, 'CSP_SCRIPT_SRC'):
-            csp_parts.append("script-src " + " ".join(settings.CSP_SCRIPT_SRC))
-        if hasattr(settings, 'CSP_STYLE_SRC'):
-            csp_parts.append("style-src " + " ".join(settings.CSP_STYLE_SRC))
-        if hasattr(settings, 'CSP_IMG_SRC'):
-            csp_parts.append("img-src " + " ".join(settings.CSP_IMG_SRC))
-        if hasattr(settings, 'CSP_FONT_SRC'):
-            csp_parts.append("font-src " + " ".join(settings.CSP_FONT_SRC))
-        if hasattr(settings, 'CSP_CONNECT_SRC'):
-            csp_parts.append("connect-src " + " ".join(settings.CSP_CONNECT_SRC))
-        if hasattr(settings, 'CSP_FRAME_ANCESTORS'):
-            csp_parts.append("frame-ancestors " + " ".join(settings.CSP_FRAME_ANCESTORS))
-        if csp_parts:
-            response['Content-Security-Policy'] = "; ".join(csp_parts)
+        xss = get_xss_header()
+        if xss:
+            response['X-XSS-Protection'] = xss
+
+        policy = get_policy(getattr(response, '_csp_overrides', None))
+        nonce = getattr(response, '_csp_nonce', None)
+        csp = policy.with_nonce(nonce) if nonce else policy.header
+        if csp:
+            response['Content-Security-Policy'] = csp
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pin a session's catalog reads to the primary database for REPLICA_PIN_SECONDS
+    after it wrote a catalog model, so users see their own changes despite replica lag.
+    Must come after SessionMiddleware. Works in both WSGI and ASGI middleware chains.
+    """
+
+    sync_capable = True
+    async_capable = True
+    SESSION_KEY = '_replica_pin_until'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        pinned = request.session.get(self.SESSION_KEY, 0) > time.time()
+        with routers.request_routing(pinned) as state:
+            response = self.get_response(request)
+        if state['wrote']:
+            request.session[self.SESSION_KEY] = self._pin_until()
+        return response
+
+    async def __acall__(self, request):
+        pinned = await request.session.aget(self.SESSION_KEY, 0) > time.time()
+        with routers.request_routing(pinned) as state:
+            response = await self.get_response(request)
+        if state['wrote']:
+            await request.session.aset(self.SESSION_KEY, self._pin_until())
+        return response
+
+    def _pin_until(self):
+        return time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+
+class PerformanceMiddleware:
+    """
+    Measure a sample of requests (METRICS_SAMPLE_RATE, 0.0-1.0): wall time, database
+    queries and time, template render time and catalog cache hits. Each measured request
+    is added to the /metrics aggregates under its view name and, with
+    METRICS_SERVER_TIMING, gets a Server-Timing header. Unsampled requests cost one
+    random() call. Put it first in MIDDLEWARE so the wall time covers the whole chain.
+    Works in both WSGI and ASGI middleware chains.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', False)
+        metrics.instrument_open_connections()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+        request_metrics, token = metrics.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish(token)
+        return self.process_response(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        request_metrics, token = metrics.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish(token)
+        return self.process_response(request, response, request_metrics)
+
+    def _sampled(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def process_response(self, request, response, request_metrics):
+        duration = time.perf_counter() - request_metrics.started
+        match = getattr(request, 'resolver_match', None)
+        metrics.observe(match.view_name if match else '<unresolved>', request_metrics, duration)
+        if self.server_timing:
+            response['Server-Timing'] = request_metrics.server_timing(duration)
+        return response
+
+
+class QueryInspectionMiddleware:
+    """
+    With QUERY_INSPECTION (default: DEBUG), report each request's repeated (N+1) and
+    slow queries with the view and template line that ran them (see querycheck.py).
+    Works in both WSGI and ASGI middleware chains.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        querycheck.instrument_open_connections()
+
+    def _enabled(self):
+        return getattr(settings, 'QUERY_INSPECTION', settings.DEBUG)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._enabled():
+            return self.get_response(request)
+        with querycheck.inspect_queries() as inspection:
+            response = self.get_response(request)
+        return self.process_response(request, response, inspection)
+
+    async def __acall__(self, request):
+        if not self._enabled():
+            return await self.get_response(request)
+        with querycheck.inspect_queries() as inspection:
+            response = await self.get_response(request)
+        return self.process_response(request, response, inspection)
+
+    def process_response(self, request, response, inspection):
+        match = getattr(request, 'resolver_match', None)
+        inspection.view = match.view_name if match else None
+        querycheck.report(inspection.offenders())
         return response
@@ -0,0 +1,145 @@
+"""
+Keyset (cursor) pagination shared by the book listing views.
+
+Instead of OFFSET, each page filters on the ordering values of the last row of the
+previous page, e.g. WHERE (title > %s) OR (title = %s AND id > %s), so fetching
+page 10,000 costs the same as page 1 when an index covers the ordering.
+Cursors are signed, so clients cannot forge arbitrary filter values. The signature
+is salted with the listing (e.g. the URL path and search query) and the ordering, so a
+cursor is rejected by any other listing, search or ordering, where its values would
+select the wrong rows.
+"""
+
+from functools import reduce
+import operator
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+
+CURSOR_SALT = 'LibraryProject.pagination.cursor'
+
+
+class InvalidCursor(InvalidPage):
+    """Raised when a cursor was tampered with or was issued for another listing or ordering."""
+
+
+class KeysetPage:
+    """One page of results plus the cursor for the next page (None on the last page)."""
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by keyset over `ordering`, which must end in a unique field
+    (normally 'pk') so that every row has a distinct position. Fields may be
+    prefixed with '-' for descending order, as with QuerySet.order_by().
+    """
+
+    def __init__(self, queryset, ordering=('title', 'pk'), per_page=None, listing=''):
+        if per_page is None:
+            per_page = getattr(settings, 'CATALOG_PAGE_SIZE', 50)
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.salt = '%s:%s:%s' % (CURSOR_SALT, listing, ','.join(self.ordering))
+
+    def _fields(self):
+        return [(f[1:], True) if f.startswith('-') else (f, False) for f in self.ordering]
+
+    def _after(self, values):
+        """Q matching rows strictly after the row whose ordering values are `values`."""
+        fields = self._fields()
+        clauses = []
+        for i, (name, descending) in enumerate(fields):
+            equal = {field: value for (field, _), value in zip(fields[:i], values[:i])}
+            lookup = '%s__%s' % (name, 'lt' if descending else 'gt')
+            clauses.append(Q(**equal) & Q(**{lookup: values[i]}))
+        # The redundant bound on the first field lets the database seek the index to the
+        # cursor; the OR alone makes SQLite scan the index from the start.
+        name, descending = fields[0]
+        bound = Q(**{'%s__%s' % (name, 'lte' if descending else 'gte'): values[0]})
+        return bound & reduce(operator.or_, clauses)
+
+    def _values(self, obj):
+        if isinstance(obj, dict):
+            # A values() row.
+            return [obj[name] for name, _ in self._fields()]
+        values = []
+        for name, _ in self._fields():
+            value = obj
+            for attr in name.split('__'):
+                value = getattr(value, attr)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, values):
+        return signing.dumps(values, salt=self.salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            values = signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            raise InvalidCursor('Invalid cursor for this listing.')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor('Cursor does not match this listing.')
+        return values
+
+    def _page_queryset(self, cursor):
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+        # Fetch one extra row to learn whether there is a next page without a COUNT.
+        return queryset[:self.per_page + 1]
+
+    def _make_page(self, rows):
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.encode_cursor(self._values(rows[-1]))
+        return KeysetPage(rows, next_cursor)
+
+    def page(self, cursor=None):
+        """Return the page that starts after `cursor`, or the first page if it is empty."""
+        return self._make_page(list(self._page_queryset(cursor)))
+
+    async def apage(self, cursor=None):
+        """Async version of page(), using the async ORM."""
+        return self._make_page([obj async for obj in self._page_queryset(cursor)])
+
+
+def paginate(request, queryset, ordering=('title', 'pk'), per_page=None, listing=None):
+    """
+    Return the KeysetPage selected by the request's ?cursor=; 404 on a bad cursor.
+    `listing` identifies what is paginated (default: the request path); include
+    anything else that selects the rows, such as a search query.
+    """
+    paginator = KeysetPaginator(queryset, ordering, per_page, request.path if listing is None else listing)
+    try:
+        return paginator.page(request.GET.get('cursor'))
+    except InvalidCursor as e:
+        raise Http404(str(e))
+
+
+async def apaginate(request, queryset, ordering=('title', 'pk'), per_page=None, listing=None):
+    """Async version of paginate()."""
+    paginator = KeysetPaginator(queryset, ordering, per_page, request.path if listing is None else listing)
+    try:
+        return await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor as e:
+        raise Http404(str(e))
@@ -0,0 +1,208 @@
+"""
+Slow-query and N+1 detection for development and CI (QueryInspectionMiddleware).
+
+While a request is inspected, an execute wrapper (installed on every connection, like
+the one in metrics.py) fingerprints each query: literals, placeholders and IN lists are
+normalized, so the queries of an N+1 loop share one shape. At the end of the request
+the detectors in QUERY_DETECTORS report offenders:
+- RepeatedQueryDetector: one shape run QUERY_REPEAT_THRESHOLD times or more (N+1);
+- SlowQueryDetector: a query slower than SLOW_QUERY_MS.
+Each offender names the view, the template line being rendered when the query ran
+(or the project code line) and an example of the SQL. Offenders are logged to the
+'LibraryProject.querycheck' logger and collected for the test runner
+(LibraryProject/test_runner.py), which fails the test run on offenders that are not
+in the QUERY_BASELINE file.
+
+A detector is any class with query(record) and offenders() methods.
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+import hashlib
+import logging
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_inspection = ContextVar('query_inspection', default=None)
+
+QueryRecord = namedtuple('QueryRecord', 'sql fingerprint duration location')
+Offender = namedtuple('Offender', 'kind view fingerprint count duration location sql')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """The shape of a query: the same for every run of it with other values."""
+    sql = _STRING.sub('%s', sql)
+    sql = _NUMBER.sub('%s', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+# Project modules that sit on every query's call stack, so never the responsible line.
+_INFRASTRUCTURE = ('querycheck.py', 'metrics.py', 'middleware.py', 'catalog_cache.py', 'manage.py')
+
+
+def _location():
+    """Template file:line being rendered, else the innermost project code line."""
+    code_line = None
+    frame = sys._getframe(2)
+    base_dir = str(settings.BASE_DIR)
+    while frame is not None:
+        node = frame.f_locals.get('self') if frame.f_code.co_name == 'render_annotated' else None
+        token = getattr(node, 'token', None)
+        if token is not None and getattr(node, 'origin', None) is not None:
+            return '%s:%s' % (node.origin.template_name or node.origin.name, token.lineno)
+        filename = frame.f_code.co_filename
+        if code_line is None and filename.startswith(base_dir) and 'site-packages' not in filename \
+                and not filename.endswith(_INFRASTRUCTURE):
+            code_line = '%s:%d' % (filename[len(base_dir) + 1:], frame.f_lineno)
+        frame = frame.f_back
+    return code_line or '<unknown>'
+
+
+class RepeatedQueryDetector:
+    """Flag query shapes run QUERY_REPEAT_THRESHOLD (default 5) or more times in one request."""
+
+    kind = 'repeated'
+
+    def __init__(self):
+        self.threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', 5)
+        self.seen = {}
+
+    def query(self, record):
+        first, count, duration = self.seen.get(record.fingerprint, (record, 0, 0.0))
+        self.seen[record.fingerprint] = (first, count + 1, duration + record.duration)
+
+    def offenders(self):
+        return [
+            (first, count, duration)
+            for first, count, duration in self.seen.values()
+            if count >= self.threshold
+        ]
+
+
+class SlowQueryDetector:
+    """Flag queries slower than SLOW_QUERY_MS (default 100)."""
+
+    kind = 'slow'
+
+    def __init__(self):
+        self.threshold = getattr(settings, 'SLOW_QUERY_MS', 100) / 1000
+        self.slow = []
+
+    def query(self, record):
+        if record.duration >= self.threshold:
+            self.slow.append((record, 1, record.duration))
+
+    def offenders(self):
+        return self.slow
+
+
+DEFAULT_DETECTORS = (
+    'LibraryProject.querycheck.RepeatedQueryDetector',
+    'LibraryProject.querycheck.SlowQueryDetector',
+)
+
+
+class Inspection:
+    """The detectors watching one request."""
+
+    def __init__(self, view=None):
+        self.view = view
+        self.detectors = [import_string(path)() for path in getattr(settings, 'QUERY_DETECTORS', DEFAULT_DETECTORS)]
+        self.locations = {}
+
+    def record(self, sql, duration):
+        shape = fingerprint(sql)
+        location = self.locations.get(shape)
+        if location is None:
+            # The first run of a shape is enough: an N+1 loop repeats the same line.
+            location = self.locations[shape] = _location()
+        record = QueryRecord(sql, shape, duration, location)
+        for detector in self.detectors:
+            detector.query(record)
+
+    def offenders(self):
+        return [
+            Offender(detector.kind, self.view or '<unresolved>', record.fingerprint, count, duration,
+                     record.location, record.sql)
+            for detector in self.detectors
+            for record, count, duration in detector.offenders()
+        ]
+
+
+@contextmanager
+def inspect_queries(view=None):
+    """Inspect the queries run inside the block; the yielded Inspection reports offenders."""
+    inspection = Inspection(view)
+    token = _inspection.set(inspection)
+    try:
+        yield inspection
+    finally:
+        _inspection.reset(token)
+
+
+def inspect_query(execute, sql, params, many, context):
+    """connection.execute_wrapper feeding queries to the current Inspection, if any."""
+    inspection = _inspection.get()
+    if inspection is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        inspection.record(sql, time.perf_counter() - started)
+
+
+def install_query_wrapper(connection):
+    if inspect_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(inspect_query)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    install_query_wrapper(connection)
+
+
+def instrument_open_connections():
+    """Instrument connections of this thread opened before this module was imported."""
+    for connection in connections.all(initialized_only=True):
+        install_query_wrapper(connection)
+
+
+# Offenders seen in this process, keyed by offender_key(); read by test_runner.QueryCheckRunner.
+collected = {}
+_lock = threading.Lock()
+
+
+def offender_key(offender):
+    """Stable key for baselines: kind, view and query shape (not the line, which moves)."""
+    digest = hashlib.sha1(offender.fingerprint.encode(), usedforsecurity=False).hexdigest()[:12]
+    return '%s:%s:%s' % (offender.kind, offender.view, digest)
+
+
+def report(offenders):
+    """Log offenders and remember them for the test runner."""
+    for offender in offenders:
+        logger.warning(
+            '%s query in %s at %s: %d run(s), %.1f ms: %s',
+            offender.kind, offender.view, offender.location, offender.count,
+            offender.duration * 1000, offender.sql[:300],
+        )
+        with _lock:
+            collected.setdefault(offender_key(offender), offender)
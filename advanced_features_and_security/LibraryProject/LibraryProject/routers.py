@@ -0,0 +1,118 @@
+"""
+Read-replica routing for the catalog (DATABASE_ROUTERS in settings.py).
+
+Reads of the catalog models (CATALOG_MODELS) go to one of DATABASE_REPLICAS; every
+write, and every read of other models (users, sessions, permissions...), goes to
+'default'. Replicas lag behind the primary, so reads are pinned to the primary:
+- for the rest of a request after it wrote a catalog model,
+- for REPLICA_PIN_SECONDS after that in the same session (ReplicaPinningMiddleware),
+- inside pin_to_primary(), for code outside requests that reads what it then writes
+  (e.g. the catalog importer),
+- inside primary_reads(), for a request filling a cache keyed by the primary's
+  version (catalog_cache.cached_catalog_page).
+Each request sticks to one replica, so its queries see one consistent snapshot.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import random
+
+from django.conf import settings
+
+CATALOG_MODELS = {
+    ('relationship_app', 'author'),
+    ('relationship_app', 'book'),
+    ('relationship_app', 'library'),
+    ('relationship_app', 'library_books'),
+    ('relationship_app', 'librarian'),
+    ('relationship_app', 'catalogentry'),
+    ('bookshelf', 'book'),
+    ('bookshelf', 'booksearchindex'),
+}
+# LibrarySnapshot is not routed: it is rebuilt on read, and a rebuild must see the
+# primary's version counter.
+
+# Per-request routing state: {'pinned': bool, 'wrote': bool, 'replica': alias or None}.
+# A mutable dict, so writes made in a sync_to_async thread are seen by the middleware.
+_state = ContextVar('replica_routing_state', default=None)
+
+
+@contextmanager
+def request_routing(pinned=False):
+    """Routing state for one request; the yielded dict tells whether the request wrote."""
+    state = {'pinned': pinned, 'wrote': False, 'replica': None}
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def pin_to_primary():
+    """Route every read to the primary inside the `with` block."""
+    return request_routing(pinned=True)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Route reads to the primary inside the `with` block, keeping the request's routing
+    state: a replica may not have the change that bumped the version a cache entry is
+    stored under yet, and the old rows would stay cached under the new version.
+    """
+    state = _state.get()
+    if state is None:
+        with pin_to_primary():
+            yield
+        return
+    pinned = state['pinned']
+    state['pinned'] = True
+    try:
+        yield
+    finally:
+        # A write inside the block keeps the rest of the request on the primary.
+        state['pinned'] = pinned or state['wrote']
+
+
+def _is_catalog(model):
+    return (model._meta.app_label, model._meta.model_name) in CATALOG_MODELS
+
+
+class ReplicaRouter:
+    def _replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', ())
+
+    def db_for_read(self, model, **hints):
+        replicas = self._replicas()
+        if not replicas or not _is_catalog(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related lookups follow the database the instance was loaded from.
+            return instance._state.db
+        state = _state.get()
+        if state is None:
+            return random.choice(replicas)
+        if state['pinned']:
+            return 'default'
+        if state['replica'] is None:
+            state['replica'] = random.choice(replicas)
+        return state['replica']
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and _is_catalog(model):
+            state['wrote'] = state['pinned'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *self._replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema and data from the primary.
+        if db in self._replicas():
+            return False
+        return None
@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'LibraryProject.middleware.PerformanceMiddleware',  # request timings -> /metrics, Server-Timing
+    'LibraryProject.middleware.QueryInspectionMiddleware',  # N+1 / slow query reports (DEBUG, tests)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,16 +55,33 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'LibraryProject.middleware.SecurityHeadersMiddleware',  # XSS filter + CSP headers
+    'LibraryProject.middleware.ReplicaPinningMiddleware',  # read-your-writes with replicas
 ]
 
 ROOT_URLCONF = 'LibraryProject.urls'
 
+# Templates are compiled once per process by the cached loader (set explicitly; the
+# development server still reloads them when a file changes). Every page extends
+# templates/base.html. Two engines share the same templates:
+# - the default engine, with the auth and messages context processors, for pages
+#   that use user/perms/messages (forms, login, dashboards);
+# - 'catalog', with only the request processor, for the catalog read views, which
+#   render with render(..., using='catalog') and skip that per-render work.
+# Both report render time to PerformanceMiddleware (TimedDjangoTemplates).
+TEMPLATE_LOADERS = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
-        'APP_DIRS': True,
+        'BACKEND': 'LibraryProject.metrics.TimedDjangoTemplates',
+        'NAME': 'django',
+        'DIRS': [BASE_DIR / 'templates'],
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -70,6 +89,17 @@ TEMPLATES = [
             ],
         },
     },
+    {
+        'BACKEND': 'LibraryProject.metrics.TimedDjangoTemplates',
+        'NAME': 'catalog',
+        'DIRS': [BASE_DIR / 'templates'],
+        'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
+            'context_processors': [
+                'django.template.context_processors.request',
+            ],
+        },
+    },
 ]
 
 WSGI_APPLICATION = 'LibraryProject.wsgi.application'
@@ -78,13 +108,158 @@ WSGI_APPLICATION = 'LibraryProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# DJANGO_DB_PROFILE selects how the database is reached (LibraryProject/db.py):
+# - 'sqlite' (default): the local SQLite file, tuned with SQLITE_PRAGMAS (WAL etc.).
+# - 'postgresql-pool': PostgreSQL through Django's native connection pool (psycopg_pool).
+# - 'postgresql': PostgreSQL with persistent connections (CONN_MAX_AGE) and health checks.
+# PostgreSQL profiles read DJANGO_DB_NAME/USER/PASSWORD/HOST/PORT and need psycopg
+# (requirements.txt). Pool sizes: DJANGO_DB_POOL_MIN_SIZE/DJANGO_DB_POOL_MAX_SIZE.
+# Under ASGI prefer 'postgresql-pool' (or DJANGO_DB_CONN_MAX_AGE=0): persistent
+# connections are per thread and are not reused across async requests.
+
+DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'sqlite')
+_conn_max_age = int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', '60'))
+_postgresql = {
+    'ENGINE': 'django.db.backends.postgresql',
+    'NAME': os.environ.get('DJANGO_DB_NAME', 'library'),
+    'USER': os.environ.get('DJANGO_DB_USER', 'library'),
+    'PASSWORD': os.environ.get('DJANGO_DB_PASSWORD', ''),
+    'HOST': os.environ.get('DJANGO_DB_HOST', 'localhost'),
+    'PORT': os.environ.get('DJANGO_DB_PORT', '5432'),
+}
+
+DATABASE_PROFILES = {
+    'sqlite': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('DJANGO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': _conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    'postgresql': {
+        **_postgresql,
+        'CONN_MAX_AGE': _conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    'postgresql-pool': {
+        **_postgresql,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('DJANGO_DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.environ.get('DJANGO_DB_POOL_MAX_SIZE', '10')),
+                'timeout': 10,
+            },
+        },
+    },
+}
+
 DATABASES = {
+    'default': DATABASE_PROFILES[DB_PROFILE],
+}
+
+# Read replicas for catalog reads (LibraryProject/routers.py). DJANGO_DB_REPLICAS is a
+# comma-separated list of replica hosts (PostgreSQL profiles) or SQLite files (sqlite
+# profile; refresh them from the primary with: python manage.py sync_sqlite_replicas).
+# Reads stay on the primary for REPLICA_PIN_SECONDS after a session writes the catalog.
+DATABASE_REPLICAS = []
+for _i, _replica in enumerate(filter(None, os.environ.get('DJANGO_DB_REPLICAS', '').split(',')), 1):
+    _location = 'NAME' if DB_PROFILE == 'sqlite' else 'HOST'
+    DATABASES['replica%d' % _i] = {**DATABASES['default'], _location: _replica.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append('replica%d' % _i)
+DATABASE_ROUTERS = ['LibraryProject.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10
+
+# Applied to every new SQLite connection by LibraryProject.db.configure_sqlite.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Shared cache for role lookups and other cached data. Defaults to local memory;
+# set DJANGO_CACHE_BACKEND/DJANGO_CACHE_LOCATION to use a file, Memcached or Redis cache.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'library-project'),
     }
 }
 
+# Seconds a user's role stays cached; entries are also dropped when the profile is saved.
+ROLE_CACHE_TIMEOUT = 3600
+
+# Seconds a user's resolved permission set stays cached; group/permission changes also invalidate it.
+PERMISSION_CACHE_TIMEOUT = 3600
+
+# Name -> pk lookups (relationship_app/lookups.py): entries in each process's LRU,
+# seconds an entry stays there (bounds how long other processes see a renamed name),
+# and seconds an entry stays in the shared cache.
+NAME_CACHE_SIZE = 1024
+NAME_CACHE_TTL = 60
+LOOKUP_CACHE_TIMEOUT = 3600
+
+
+# JSON API (LibraryProject/api.py): largest page a client may ask for with ?limit=.
+API_MAX_PAGE_SIZE = 500
+
+
+# Request metrics (LibraryProject/metrics.py, PerformanceMiddleware)
+# METRICS_SAMPLE_RATE: fraction of requests measured (0 disables measuring).
+# METRICS_SERVER_TIMING: add a Server-Timing header to measured responses; it reveals
+# query counts and timings, so it is off unless DEBUG or DJANGO_SERVER_TIMING is set.
+# METRICS_TOKEN: bearer token for the Prometheus scraper at /metrics (else staff only).
+
+METRICS_SAMPLE_RATE = float(os.environ.get('DJANGO_METRICS_SAMPLE_RATE', '1.0'))
+METRICS_SERVER_TIMING = os.environ.get('DJANGO_SERVER_TIMING', str(DEBUG)).lower() in ('true', '1', 'yes')
+METRICS_TOKEN = os.environ.get('DJANGO_METRICS_TOKEN', '')
+
+
+# Query inspection (LibraryProject/querycheck.py, QueryInspectionMiddleware)
+# Reports N+1 and slow queries per request; on with DEBUG and in tests (TEST_RUNNER).
+# The test run fails on repeated-query offenders missing from QUERY_BASELINE;
+# accept the current ones with: python manage.py test --update-query-baseline
+
+QUERY_INSPECTION = os.environ.get('DJANGO_QUERY_INSPECTION', str(DEBUG)).lower() in ('true', '1', 'yes')
+QUERY_REPEAT_THRESHOLD = 5
+SLOW_QUERY_MS = 100
+QUERY_BASELINE = BASE_DIR / 'query_baseline.json'
+TEST_RUNNER = 'LibraryProject.test_runner.QueryCheckRunner'
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/6.0/topics/auth/passwords/
+# DJANGO_PASSWORD_HASH_PROFILE selects the algorithm and cost used for new hashes
+# (LibraryProject/hashers.py). Existing hashes keep verifying; they are rehashed with
+# the active profile on the user's next login. 'argon2' needs the argon2-cffi package.
+# Measure logins/sec per core for each profile with: python manage.py benchmark_hashers
+
+PASSWORD_HASH_PROFILES = {
+    # Django's default PBKDF2-SHA256 cost.
+    'default': {'hasher': 'pbkdf2'},
+    # OWASP minimum for PBKDF2-SHA256: cheaper logins, still acceptable.
+    'pbkdf2-fast': {'hasher': 'pbkdf2', 'iterations': 600_000},
+    # OWASP recommended minimums for Argon2id and scrypt.
+    'argon2': {'hasher': 'argon2', 'time_cost': 2, 'memory_cost': 19456, 'parallelism': 1},
+    'scrypt': {'hasher': 'scrypt', 'work_factor': 2 ** 17, 'block_size': 8, 'parallelism': 1},
+}
+PASSWORD_HASH_PROFILE = os.environ.get('DJANGO_PASSWORD_HASH_PROFILE', 'default')
+
+_PROFILE_HASHERS = {
+    'pbkdf2': 'LibraryProject.hashers.TunedPBKDF2PasswordHasher',
+    'argon2': 'LibraryProject.hashers.TunedArgon2PasswordHasher',
+    'scrypt': 'LibraryProject.hashers.TunedScryptPasswordHasher',
+}
+# The first hasher is used for new hashes; the rest only verify (and upgrade) old ones.
+_preferred_hasher = _PROFILE_HASHERS[PASSWORD_HASH_PROFILES[PASSWORD_HASH_PROFILE]['hasher']]
+PASSWORD_HASHERS = [_preferred_hasher] + [h for h in _PROFILE_HASHERS.values() if h != _preferred_hasher] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -121,6 +296,12 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/topics/auth/customizing/#substituting-a-custom-user-model
 AUTH_USER_MODEL = 'bookshelf.CustomUser'
 
+# Loads the user's profile (role) in the same query as the user on every request,
+# and caches each user's resolved permission set in the shared cache.
+AUTHENTICATION_BACKENDS = [
+    'relationship_app.backends.CachingModelBackend',
+]
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
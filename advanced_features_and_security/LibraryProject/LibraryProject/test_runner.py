@@ -0,0 +1,82 @@
+"""
+Test runner that turns the query inspection of querycheck.py into a CI gate.
+
+Kept out of querycheck.py, which QueryInspectionMiddleware imports at startup, so
+that serving requests never imports django.test.
+"""
+
+import json
+import sys
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+from .querycheck import collected
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return set(json.load(f))
+    except FileNotFoundError:
+        return set()
+
+
+class QueryCheckRunner(DiscoverRunner):
+    """
+    Test runner that inspects every request made by the tests and fails the run when an
+    offender of a kind in QUERY_CHECK_FAIL_ON (default: repeated only, since timings
+    vary between machines) is not listed in the QUERY_BASELINE file. Run with
+    --update-query-baseline to accept the current offenders.
+    """
+
+    def __init__(self, update_query_baseline=False, **kwargs):
+        super().__init__(**kwargs)
+        self.update_query_baseline = update_query_baseline
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--update-query-baseline', action='store_true',
+            help='Write the offenders found by this run to QUERY_BASELINE.',
+        )
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._inspection_setting = override_settings(QUERY_INSPECTION=True)
+        self._inspection_setting.enable()
+        collected.clear()
+
+    def teardown_test_environment(self, **kwargs):
+        self._inspection_setting.disable()
+        super().teardown_test_environment(**kwargs)
+
+    @staticmethod
+    def baseline_path():
+        return getattr(settings, 'QUERY_BASELINE', settings.BASE_DIR / 'query_baseline.json')
+
+    def found_offenders(self):
+        """{key: offender} collected so far, of the kinds in QUERY_CHECK_FAIL_ON."""
+        fail_on = getattr(settings, 'QUERY_CHECK_FAIL_ON', ('repeated',))
+        return {key: offender for key, offender in collected.items() if offender.kind in fail_on}
+
+    def new_offenders(self):
+        """found_offenders() that are not in the QUERY_BASELINE file."""
+        baseline = load_baseline(self.baseline_path())
+        return {key: offender for key, offender in self.found_offenders().items() if key not in baseline}
+
+    def suite_result(self, suite, result, **kwargs):
+        failures = super().suite_result(suite, result, **kwargs)
+        if self.update_query_baseline:
+            with open(self.baseline_path(), 'w') as f:
+                json.dump(sorted(self.found_offenders()), f, indent=2)
+                f.write('\n')
+            return failures
+        new = self.new_offenders()
+        for key, offender in sorted(new.items()):
+            sys.stderr.write('New %s query offender %s\n  at %s (%d runs): %s\n' % (
+                offender.kind, key, offender.location, offender.count, offender.fingerprint[:300]
+            ))
+        return failures + len(new)
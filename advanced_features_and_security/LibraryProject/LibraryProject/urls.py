@@ -19,8 +19,13 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from LibraryProject.api import api_view
+from LibraryProject.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/<path:resource>/', api_view, name='api'),
     path('bookshelf/', include('bookshelf.urls')),
     path('', include('relationship_app.urls')),
 ]
@@ -0,0 +1,52 @@
+"""
+Measure the cost of a deep page: keyset pagination (LibraryProject/pagination.py)
+against OFFSET pagination with Django's Paginator.
+
+    python manage.py benchmark_pagination --page 10000 --repeat 5
+
+Enough books for --page pages of CATALOG_PAGE_SIZE are generated inside a transaction
+that is rolled back at the end. The keyset page is fetched with the cursor a client
+would hold after paging that far; the OFFSET page includes the COUNT query that
+Paginator runs. Both are ordered by (title, pk), and reported as the best of
+--repeat runs.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+
+from bookshelf.models import Book
+from LibraryProject.benchmarking import best_of, rolled_back
+from LibraryProject.pagination import KeysetPaginator
+
+from .benchmark_search import seed_books
+
+ORDERING = ('title', 'pk')
+
+
+class Command(BaseCommand):
+    help = 'Report the time to fetch a deep page with keyset and with OFFSET pagination.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=10000, help='Page number to fetch.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (best is reported).')
+
+    def handle(self, *args, **options):
+        if options['page'] < 1:
+            raise CommandError('--page must be at least 1.')
+        per_page = getattr(settings, 'CATALOG_PAGE_SIZE', 50)
+        with rolled_back():
+            seed_books(options['page'] * per_page)
+            for number in sorted({1, options['page']}):
+                self.report(number, per_page, options['repeat'])
+
+    def report(self, number, per_page, repeat):
+        queryset = Book.objects.order_by(*ORDERING)
+        keyset = KeysetPaginator(queryset, ORDERING, per_page)
+        cursor = None
+        if number > 1:
+            # The last row of the previous page, as encoded in that page's next cursor.
+            cursor = keyset.encode_cursor(list(queryset.values_list(*ORDERING)[(number - 1) * per_page - 1]))
+        keyset_ms = best_of(lambda: keyset.page(cursor), repeat)
+        offset_ms = best_of(lambda: list(Paginator(queryset, per_page).page(number)), repeat)
+        self.stdout.write('page %-7d keyset %8.2f ms  offset %8.2f ms' % (number, keyset_ms, offset_ms))
@@ -0,0 +1,76 @@
+"""
+Measure search latency on a large catalog: the search index (bookshelf/search.py)
+against the icontains scan that book_list used before it.
+
+    python manage.py benchmark_search --books 1000000 --repeat 5
+
+The books are generated inside a transaction that is rolled back at the end, so the
+database is left as it was (the search index triggers run for them like for any
+insert). Each query is timed for the first page of results (CATALOG_PAGE_SIZE rows,
+as book_list fetches them) and reported as the best of --repeat runs.
+"""
+
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from bookshelf.models import Book
+from bookshelf.search import fts_available, search_books
+from LibraryProject.benchmarking import best_of, rolled_back
+
+WORDS = (
+    'river', 'night', 'garden', 'silver', 'winter', 'shadow', 'empire', 'stone', 'ocean',
+    'forest', 'crown', 'glass', 'storm', 'letter', 'island', 'mountain', 'secret', 'fire',
+    'house', 'song', 'road', 'star', 'ghost', 'summer', 'iron', 'dream', 'king', 'moon',
+)
+SURNAMES = ('Austen', 'Tolkien', 'Morrison', 'Achebe', 'Woolf', 'Borges', 'Murakami', 'Atwood')
+
+# A common word, a rare title, a name and a word prefix (what is typed while searching).
+QUERIES = ('river', 'hobbit', 'tolkien', 'moun')
+
+
+def seed_books(count, batch_size=10000):
+    """Insert `count` generated bookshelf books, plus 'The Hobbit' as a rare match."""
+    rng = random.Random(0)
+    Book.objects.create(title='The Hobbit', author='J. R. R. Tolkien', publication_year=1937)
+    for start in range(0, count, batch_size):
+        Book.objects.bulk_create([
+            Book(
+                title=' '.join(rng.choice(WORDS) for _ in range(3)).capitalize(),
+                author='%s %d' % (rng.choice(SURNAMES), i % 1000),
+                publication_year=1900 + i % 120,
+            )
+            for i in range(start, min(start + batch_size, count))
+        ])
+
+
+class Command(BaseCommand):
+    help = 'Report search latency with the search index and with the icontains scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000000, help='Books to generate.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (best is reported).')
+        parser.add_argument('queries', nargs='*', help='Default: %s.' % ', '.join(QUERIES))
+
+    def handle(self, *args, **options):
+        if options['books'] < 1:
+            raise CommandError('--books must be at least 1.')
+        with rolled_back():
+            started = time.perf_counter()
+            seed_books(options['books'])
+            self.stdout.write('Generated %d books in %.1f s (index: %s)' % (
+                options['books'], time.perf_counter() - started,
+                'FTS5' if fts_available() else 'none, both columns use the scan',
+            ))
+            for query in options['queries'] or QUERIES:
+                self.report(query, options['repeat'])
+
+    def report(self, query, repeat):
+        per_page = getattr(settings, 'CATALOG_PAGE_SIZE', 50)
+        scan = Book.objects.filter(Q(title__icontains=query) | Q(author__icontains=query)).order_by('title', 'pk')
+        indexed = best_of(lambda: list(search_books(query)[:per_page]), repeat)
+        scanned = best_of(lambda: list(scan[:per_page]), repeat)
+        self.stdout.write('%-12s index %9.2f ms  icontains %9.2f ms' % (query, indexed, scanned))
@@ -0,0 +1,90 @@
+# Full-text search index for bookshelf.Book (see bookshelf/search.py).
+# SQLite: external-content FTS5 table over title/author, kept in sync by triggers,
+# so every save/delete (including bulk_create and queryset update/delete) updates it.
+# PostgreSQL: pg_trgm GIN indexes on UPPER(title)/UPPER(author), which icontains uses.
+# Other backends, or SQLite builds without FTS5, keep the plain icontains search.
+
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE bookshelf_book_fts USING fts5(
+        title, author,
+        content='bookshelf_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER bookshelf_book_fts_ai AFTER INSERT ON bookshelf_book BEGIN
+        INSERT INTO bookshelf_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END""",
+    """CREATE TRIGGER bookshelf_book_fts_ad AFTER DELETE ON bookshelf_book BEGIN
+        INSERT INTO bookshelf_book_fts(bookshelf_book_fts, rowid, title, author)
+        VALUES ('delete', old.id, old.title, old.author);
+    END""",
+    """CREATE TRIGGER bookshelf_book_fts_au AFTER UPDATE OF title, author ON bookshelf_book BEGIN
+        INSERT INTO bookshelf_book_fts(bookshelf_book_fts, rowid, title, author)
+        VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO bookshelf_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END""",
+    # Index rows that existed before this migration.
+    "INSERT INTO bookshelf_book_fts(bookshelf_book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS bookshelf_book_fts_au',
+    'DROP TRIGGER IF EXISTS bookshelf_book_fts_ad',
+    'DROP TRIGGER IF EXISTS bookshelf_book_fts_ai',
+    'DROP TABLE IF EXISTS bookshelf_book_fts',
+]
+
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS bookshelf_book_title_trgm ON bookshelf_book USING gin (UPPER(title) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS bookshelf_book_author_trgm ON bookshelf_book USING gin (UPPER(author) gin_trgm_ops)',
+]
+
+POSTGRESQL_REVERSE = [
+    'DROP INDEX IF EXISTS bookshelf_book_author_trgm',
+    'DROP INDEX IF EXISTS bookshelf_book_title_trgm',
+]
+
+
+def sqlite_has_fts5(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def create_search_index(apps, schema_editor):
+    """Create the backend-specific search index, if the backend supports one."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite' and sqlite_has_fts5(schema_editor):
+        statements = SQLITE_FORWARD
+    elif vendor == 'postgresql':
+        statements = POSTGRESQL_FORWARD
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    """Drop the search index (reverse migration)."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_REVERSE
+    elif vendor == 'postgresql':
+        statements = POSTGRESQL_REVERSE
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshelf', '0003_book_custom_permissions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshelf', '0005_book_title_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'title'], name='bs_book_author_title_idx'),
+        ),
+    ]
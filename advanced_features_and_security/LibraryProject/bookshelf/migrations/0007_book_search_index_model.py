@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:41
+
+import bookshelf.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookshelf', '0006_book_author_title_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchIndex',
+            fields=[
+                ('book', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='bookshelf.book')),
+                ('document', bookshelf.models.SearchDocumentField(db_column='bookshelf_book_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'bookshelf_book_fts',
+                'managed': False,
+            },
+        ),
+    ]
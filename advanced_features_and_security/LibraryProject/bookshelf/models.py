@@ -1,5 +1,16 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser, BaseUserManager
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import django
+from django.apps import apps
+from django.db import models, transaction
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AbstractUser, BaseUserManager, Group
+from django.core.exceptions import ValidationError
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from LibraryProject import catalog_cache, changes
 
 
 class CustomUserManager(BaseUserManager):
@@ -30,6 +41,108 @@ class CustomUserManager(BaseUserManager):
 
         return self.create_user(username, email, password, **extra_fields)
 
+    # Optional per-user columns accepted by bulk_create_users besides username/email/password/groups.
+    BULK_EXTRA_FIELDS = ('first_name', 'last_name', 'date_of_birth')
+
+    def bulk_create_users(self, rows, groups=(), role=None, batch_size=1000, workers=None, progress=None):
+        """
+        Create many users from dicts with username, email, password and optionally
+        first_name, last_name, date_of_birth and groups (a list or '|'-separated names).
+
+        Passwords are hashed in a process pool (`workers` processes, default one per
+        CPU; 0 hashes inline). Each batch is one transaction: users, their UserProfile
+        rows (with `role`) and their group memberships (`groups` for everyone, plus each
+        row's own; unknown per-row names are ignored) are inserted with bulk_create. Existing usernames are skipped, so a
+        re-run only adds the missing users; so are rows whose extra fields fail validation. `progress(stats)` is called after each batch.
+        Returns LibraryProject.importer.ImportStats.
+        """
+        from LibraryProject.importer import ImportStats, batched
+
+        group_ids = dict(Group.objects.values_list('name', 'pk'))
+        missing = set(groups) - group_ids.keys()
+        if missing:
+            raise ValueError('Unknown group(s): %s' % ', '.join(sorted(missing)))
+        stats = ImportStats()
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_hasher_process,
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),),
+        ) if workers != 0 else None
+        try:
+            for batch in batched(rows, batch_size):
+                stats.rows += len(batch)
+                self._bulk_create_user_batch(batch, groups, group_ids, role, pool, stats)
+                if progress:
+                    progress(stats)
+        finally:
+            if pool:
+                pool.shutdown()
+        return stats
+
+    def _bulk_create_user_batch(self, rows, groups, group_ids, role, pool, stats):
+        # Normalize first, so the existence check sees the usernames that would be inserted.
+        usernames = [self.model.normalize_username((row.get('username') or '').strip()) for row in rows]
+        existing = set(self.filter(username__in=set(usernames)).values_list('username', flat=True))
+        new_rows, seen = [], set()
+        for username, row in zip(usernames, rows):
+            if not username or username in existing or username in seen:
+                stats.skipped += 1
+                continue
+            try:
+                extra = self._clean_extra_fields(row)
+            except ValidationError:
+                # e.g. an unparsable date_of_birth: skip the row, not the whole batch.
+                stats.skipped += 1
+                continue
+            seen.add(username)
+            new_rows.append((username, row, extra))
+        if not new_rows:
+            return
+
+        passwords = [row.get('password') or None for _, row, _ in new_rows]
+        if pool:
+            hashes = list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // 32)))
+        else:
+            hashes = [make_password(password) for password in passwords]
+
+        users = []
+        for (username, row, extra), password in zip(new_rows, hashes):
+            users.append(self.model(
+                username=username,
+                email=self.normalize_email(row.get('email') or ''),
+                password=password,
+                **extra
+            ))
+
+        UserProfile = apps.get_model('relationship_app', 'UserProfile')
+        Membership = self.model.groups.through
+        with transaction.atomic(using=self._db):
+            users = self.bulk_create(users)
+            UserProfile.objects.bulk_create_for_users(users, role=role)
+            memberships = []
+            for user, (_, row, _) in zip(users, new_rows):
+                names = row.get('groups') or []
+                if isinstance(names, str):
+                    names = [name for name in names.split('|') if name]
+                for name in set(groups) | set(names):
+                    if name in group_ids:
+                        memberships.append(Membership(customuser_id=user.pk, group_id=group_ids[name]))
+            Membership.objects.bulk_create(memberships)
+        stats.created += len(users)
+
+    def _clean_extra_fields(self, row):
+        """The BULK_EXTRA_FIELDS set in `row`, converted and validated by their model fields."""
+        return {
+            name: self.model._meta.get_field(name).clean(row[name], None)
+            for name in self.BULK_EXTRA_FIELDS if row.get(name)
+        }
+
+
+def _init_hasher_process(settings_module):
+    """Configure Django in password-hashing worker processes (needed when they are spawned, not forked)."""
+    if settings_module:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
 
 class CustomUser(AbstractUser):
     """
@@ -60,6 +173,54 @@ class Book(models.Model):
             ('can_edit', 'Can edit'),
             ('can_delete', 'Can delete'),
         ]
+        indexes = [
+            # Backs keyset pagination over (title, pk) in book_list.
+            models.Index(fields=['title', 'id'], name='bookshelf_book_title_id_idx'),
+            # Lookups by author and the (title, author) natural key used by the importer.
+            models.Index(fields=['author', 'title'], name='bs_book_author_title_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.title} by {self.author} ({self.publication_year})"
\ No newline at end of file
+        return f"{self.title} by {self.author} ({self.publication_year})"
+
+
+class Match(models.Lookup):
+    """`field__match=expression`: an FTS5 MATCH, with the expression as a parameter."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '%s MATCH %s' % (lhs, rhs), (*lhs_params, *rhs_params)
+
+
+class SearchDocumentField(models.TextField):
+    """FTS5's hidden column named after the table: matching it searches every indexed column."""
+
+
+SearchDocumentField.register_lookup(Match)
+
+
+class BookSearchIndex(models.Model):
+    """
+    The SQLite FTS5 table over Book title/author (migration 0004, kept in sync by
+    triggers), so that searches can join it through Book.search_index (see search.py).
+    Read-only, and absent on other backends.
+    """
+    book = models.OneToOneField(
+        Book, models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='search_index',
+    )
+    document = SearchDocumentField(db_column='bookshelf_book_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'bookshelf_book_fts'
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_cached_book_list(sender, **kwargs):
+    """Invalidate cached book_list pages (LibraryProject/catalog_cache.py) and record the change time."""
+    catalog_cache.bump('bookshelf:books')
+    changes.touch(sender)
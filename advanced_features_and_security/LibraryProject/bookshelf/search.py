@@ -0,0 +1,128 @@
+"""
+Full-text search over bookshelf.Book title/author.
+
+SQLite: an external-content FTS5 table (bookshelf_book_fts) kept in sync with
+bookshelf_book by triggers (see migration 0004). PostgreSQL: pg_trgm GIN indexes
+on title/author, ranked by trigram similarity. Anything else, or an SQLite build
+without FTS5, falls back to the original icontains filter.
+
+The FTS5 table is joined through the unmanaged BookSearchIndex model
+(Book.search_index). It matches whole words (and prefixes of the last word), not
+arbitrary substrings, so it finds less than the icontains filter it replaced: a
+search whose MATCH finds nothing (e.g. 'obbit' for "The Hobbit") runs the icontains
+filter instead, but when any book matches by word, books that only contain the
+query inside a word are not found. The fallback costs one EXISTS query on the index
+per search.
+
+User input is never formatted into SQL: the MATCH expression is passed as a
+query parameter, and each search term is quoted so FTS5 operators are inert.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+
+from .models import Book
+
+FTS_TABLE = 'bookshelf_book_fts'
+
+# Results are ordered by rank then pk; lower rank is a better match (as with FTS5 bm25).
+SEARCH_ORDERING = ('rank', 'pk')
+
+_fts_available = {}
+
+
+def fts_available(using='default'):
+    """Return True if the FTS5 index table exists on the given database (checked once)."""
+    if using not in _fts_available:
+        connection = connections[using]
+        _fts_available[using] = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available[using]
+
+
+def build_match_expression(query):
+    """
+    Turn free text into a safe FTS5 MATCH expression: every term is a quoted
+    string (so AND/OR/NEAR/column filters in user input are literal text) and
+    the last term is a prefix query, so partial words match while typing.
+    """
+    terms = ['"%s"' % term.replace('"', '""') for term in query.split()]
+    if not terms:
+        return None
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_books(query, queryset=None, using='default'):
+    """
+    Return books matching query, annotated with `rank` and ordered by SEARCH_ORDERING.
+    """
+    if queryset is None:
+        queryset = Book.objects.using(using)
+    vendor = connections[using].vendor
+
+    if vendor == 'sqlite' and fts_available(using):
+        matches = fts_matches(query, queryset)
+        if matches is None:
+            return queryset.none()
+        if not matches.exists():
+            return _substring_matches(query, queryset)
+        return matches
+
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        from django.db.models.functions import Greatest
+
+        # icontains compiles to UPPER(col) LIKE UPPER(%s), which the GIN trigram
+        # indexes on UPPER(title)/UPPER(author) serve. Similarity only ranks the matches,
+        # negated so that, as with bm25, a lower rank is a better match.
+        rank = -Greatest(TrigramSimilarity('title', query), TrigramSimilarity('author', query))
+        return (
+            queryset.filter(Q(title__icontains=query) | Q(author__icontains=query))
+            .annotate(rank=rank)
+            .order_by(*SEARCH_ORDERING)
+        )
+
+    return _substring_matches(query, queryset)
+
+
+def fts_matches(query, queryset):
+    """FTS5 matches of `query`, ranked, without the substring fallback; None if the query has no terms."""
+    expression = build_match_expression(query)
+    if expression is None:
+        return None
+    # Join the index table once, so MATCH runs once and each row reads its own rank
+    # (a rank subquery per row would re-run the MATCH for every matching book).
+    return (
+        queryset.filter(search_index__document__match=expression)
+        .annotate(rank=F('search_index__rank'))
+        .order_by(*SEARCH_ORDERING)
+    )
+
+
+def _substring_matches(query, queryset):
+    """The original ORM scan, with a constant rank so callers can order the same way."""
+    return (
+        queryset.filter(Q(title__icontains=query) | Q(author__icontains=query))
+        .annotate(rank=Value(0.0, output_field=FloatField()))
+        .order_by(*SEARCH_ORDERING)
+    )
+
+
+async def asearch_books(query, queryset=None, using='default'):
+    """Async version of search_books(): the index checks run with the async ORM or off the event loop."""
+    if queryset is None:
+        queryset = Book.objects.using(using)
+    if using not in _fts_available:
+        await sync_to_async(fts_available)(using)
+    if connections[using].vendor == 'sqlite' and fts_available(using):
+        matches = fts_matches(query, queryset)
+        if matches is None:
+            return queryset.none()
+        if not await matches.aexists():
+            return _substring_matches(query, queryset)
+        return matches
+    return search_books(query, queryset, using)
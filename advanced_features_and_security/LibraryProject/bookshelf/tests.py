@@ -1,3 +1,130 @@
-from django.test import TestCase
+import json
+import zlib
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .models import Book
+from .search import search_books
+
+
+# No cache: every request does all of its work, and permissions are loaded from the
+# database (once for the permission check, once for the page cache key).
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class BookListQueryCountTests(TestCase):
+    """book_list runs a fixed number of queries however many books there are."""
+
+    # session, user, permissions twice, one page of books
+    QUERIES = 5
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+    def add_books(self, n):
+        Book.objects.bulk_create(
+            Book(title='Book %d' % i, author='Author %d' % i, publication_year=2000) for i in range(n)
+        )
+
+    def test_book_list(self):
+        self.add_books(10)
+        with self.assertNumQueries(self.QUERIES):
+            self.client.get(reverse('bookshelf:book_list'), secure=True)
+        self.add_books(90)
+        with self.assertNumQueries(self.QUERIES):
+            self.client.get(reverse('bookshelf:book_list'), secure=True)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}, CATALOG_PAGE_SIZE=2)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        Book.objects.bulk_create([
+            Book(title='The Hobbit', author='J. R. R. Tolkien', publication_year=1937),
+            Book(title='The Silmarillion', author='J. R. R. Tolkien', publication_year=1977),
+            Book(title='Tolkien: A Biography', author='Humphrey Carpenter', publication_year=1977),
+            Book(title='Emma', author='Jane Austen', publication_year=1815),
+        ])
+
+    def titles(self, query, cursor=None):
+        params = {'query': query, **({'cursor': cursor} if cursor else {})}
+        response = self.client.get(reverse('bookshelf:book_list'), params, secure=True)
+        page = response.context['page']
+        return [book.title for book in page], page.next_cursor
+
+    def test_words_and_prefixes(self):
+        self.assertEqual([book.title for book in search_books('hobb')], ['The Hobbit'])
+        self.assertEqual(self.titles('silmarillion')[0], ['The Silmarillion'])
+
+    def test_substring_falls_back_to_icontains(self):
+        self.assertEqual([book.title for book in search_books('obbit')], ['The Hobbit'])
+        self.assertEqual(self.titles('obbit')[0], ['The Hobbit'])
+        self.assertEqual(self.titles('nothing like it')[0], [])
+
+    def test_substrings_are_not_found_when_a_word_matches(self):
+        Book.objects.create(title='The Ring', author='Anon', publication_year=2000)
+        Book.objects.create(title='Bring Up the Bodies', author='Hilary Mantel', publication_year=2012)
+        self.assertEqual([book.title for book in search_books('ring')], ['The Ring'])
+        self.assertEqual([book.title for book in search_books('ring up')], ['Bring Up the Bodies'])
+
+    def test_ranked_results_are_paginated(self):
+        first, cursor = self.titles('tolkien')
+        second, last = self.titles('tolkien', cursor)
+        self.assertEqual(len(first), 2)
+        self.assertIsNone(last)
+        self.assertCountEqual(first + second, ['The Hobbit', 'The Silmarillion', 'Tolkien: A Biography'])
+
+    def test_search_echoes_the_normalized_query(self):
+        for query in ('  The   HOBBIT ', 'the hobbit'):
+            response = self.client.get(reverse('bookshelf:book_list'), {'query': query}, secure=True)
+            self.assertContains(response, 'value="the hobbit"')
+            self.assertNotContains(response, 'HOBBIT')
+
+    def test_cursor_is_bound_to_the_search(self):
+        cursor = self.titles('tolkien')[1]
+        for query in ('hobbit', ''):
+            response = self.client.get(reverse('bookshelf:book_list'), {'query': query, 'cursor': cursor}, secure=True)
+            self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('relationship_app:list_books'), {'cursor': cursor}, secure=True)
+        self.assertEqual(response.status_code, 404)
+
+
+class BulkCreateUsersTests(TestCase):
+    def test_usernames_are_normalized_before_the_existence_check(self):
+        User = get_user_model()
+        User.objects.create_user('u', password='secret')
+        stats = User.objects.bulk_create_users(
+            [{'username': 'u '}, {'username': ' v'}, {'username': 'v'}, {'username': ''}], workers=0,
+        )
+        self.assertEqual((stats.created, stats.skipped), (1, 3))
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['u', 'v'])
+
+    def test_rows_with_invalid_extra_fields_are_skipped(self):
+        User = get_user_model()
+        stats = User.objects.bulk_create_users([
+            {'username': 'a', 'date_of_birth': '1990-02-30'},
+            {'username': 'b', 'first_name': 'x' * 151},
+            {'username': 'c', 'date_of_birth': '1990-02-03', 'first_name': 'Cee'},
+        ], workers=0)
+        self.assertEqual((stats.created, stats.skipped), (1, 2))
+        user = User.objects.get()
+        self.assertEqual((user.username, user.first_name, str(user.date_of_birth)), ('c', 'Cee', '1990-02-03'))
+
+
+class ExportTests(TestCase):
+    def test_gzip_jsonl_export(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        books = Book.objects.bulk_create([
+            Book(title='Emma', author='Jane Austen', publication_year=1815),
+            Book(title='The Hobbit', author='J. R. R. Tolkien', publication_year=1937),
+        ])
+        response = self.client.get(
+            reverse('bookshelf:export_books'), {'format': 'jsonl', 'compress': 'gzip'}, secure=True,
+        )
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="bookshelf.jsonl.gz"')
+        lines = zlib.decompress(b''.join(response.streaming_content), 31).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'id': book.pk, 'title': book.title, 'author': book.author, 'publication_year': book.publication_year}
+            for book in books
+        ])
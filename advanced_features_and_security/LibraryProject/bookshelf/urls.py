@@ -6,4 +6,5 @@ app_name = 'bookshelf'
 urlpatterns = [
     path('', views.book_list, name='book_list'),
     path('form/', views.form_example, name='form_example'),
+    path('export/', views.export_books, name='export_books'),
 ]
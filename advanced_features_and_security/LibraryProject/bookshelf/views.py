@@ -1,26 +1,48 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import permission_required
-from django.db.models import Q
 
+from LibraryProject.catalog_cache import cached_catalog_page, normalize_query
+from LibraryProject.changes import conditional
+from LibraryProject.export import export_response
+from LibraryProject.pagination import apaginate
 from .models import Book
 from .forms import BookForm, BookSearchForm
 from .forms import ExampleForm
+from .search import SEARCH_ORDERING, asearch_books
 
 
 @permission_required('bookshelf.can_view', raise_exception=True)
-def book_list(request):
+@conditional('book_list', [Book])
+@cached_catalog_page('book_list', lambda request: ['bookshelf:books'])
+async def book_list(request):
     """
-    List books; optional safe search via form. Uses ORM only (parameterized queries),
-    no raw SQL, to prevent SQL injection. User input validated/sanitized by BookSearchForm.
+    List books; optional safe search via form. Search goes through the full-text index
+    (bookshelf/search.py) with the query passed as a parameter, never formatted into SQL.
+    User input validated/sanitized by BookSearchForm. Results are keyset-paginated via
+    ?cursor=: by (title, pk) when listing, by (rank, pk) when searching. Async: the page
+    is loaded with the async ORM before rendering. Rendered pages, including search
+    results for the normalized query, are cached until a Book changes; until then a
+    revalidating client gets a 304 without any query (see changes.py).
     """
     books = Book.objects.all()
-    form = BookSearchForm(request.GET or None)
+    ordering = ('title', 'pk')
+    query = ''
+    # Searches that differ only in case or spacing share a cached page, so the page
+    # searches for and echoes the normalized query.
+    params = request.GET.copy()
+    if 'query' in params:
+        params.setlist('query', [normalize_query(value) for value in params.getlist('query')])
+    form = BookSearchForm(params or None)
     if form.is_valid():
         query = form.cleaned_data.get('query')
         if query:
-            # ORM filter is parameterized; never use string formatting for SQL.
-            books = books.filter(Q(title__icontains=query) | Q(author__icontains=query))
-    return render(request, 'bookshelf/book_list.html', {'books': books, 'form': form})
+            # Ranked results from the search index; falls back to icontains where unsupported.
+            books = await asearch_books(query, books)
+            ordering = SEARCH_ORDERING
+    # Cursors of one search are not valid for another.
+    page = await apaginate(request, books, ordering, listing='%s?query=%s' % (request.path, query))
+    context = {'books': page, 'page': page, 'form': form, 'query': query}
+    return render(request, 'bookshelf/book_list.html', context, using='catalog')
 
 
 @permission_required('bookshelf.can_create', raise_exception=True)
@@ -37,3 +59,12 @@ def form_example(request):
     else:
         form = BookForm()
     return render(request, 'bookshelf/form_example.html', {'form': form})
+
+
+@permission_required('bookshelf.can_view', raise_exception=True)
+def export_books(request):
+    """
+    Stream all books as CSV or JSONL (?format=csv|jsonl), optionally gzip-compressed
+    (?compress=gzip). Rows are read in chunks, so memory stays constant.
+    """
+    return export_response(request, 'bookshelf')
@@ -3,3 +3,23 @@ from django.apps import AppConfig
 
 class RelationshipAppConfig(AppConfig):
     name = 'relationship_app'
+
+    def ready(self):
+        # Connects the SQLite PRAGMA hook (connection_created).
+        from LibraryProject import db  # noqa: F401
+        from LibraryProject import metrics
+
+        from . import lookups, snapshots
+
+        metrics.register_gauge(
+            'catalog_library_snapshots_stale', 'Library snapshots waiting for a rebuild.',
+            lambda: snapshots.stale_stats()[0],
+        )
+        metrics.register_gauge(
+            'catalog_library_snapshot_staleness_seconds', 'Age of the oldest stale library snapshot.',
+            lambda: '%.3f' % snapshots.stale_stats()[1],
+        )
+        metrics.register_gauge(
+            'relationship_name_lookup_hit_ratio', 'Share of name lookups answered by the LRU or shared cache.',
+            lambda: '%.4f' % lookups.stats()['hit_ratio'],
+        )
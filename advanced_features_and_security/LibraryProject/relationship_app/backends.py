@@ -0,0 +1,146 @@
+"""
+Authentication backend for the project (AUTHENTICATION_BACKENDS in settings.py).
+
+Resolved permission sets are stored in the shared cache under versioned keys.
+Changing a user's groups or permissions deletes that user's entry; changing a
+group's permissions or a Permission bumps the global version, which retires every
+entry at once (receivers in relationship_app/models.py). Both happen when the
+transaction commits: before it, a concurrent request could cache the old permissions
+again, and keep them until PERMISSION_CACHE_TIMEOUT.
+
+Async logins hash the password in a worker thread instead of on the event loop;
+PBKDF2/scrypt/argon2 release the GIL, so other requests keep being served meanwhile.
+"""
+
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import make_password, verify_password
+from django.core.cache import cache
+from django.db import transaction
+
+UserModel = get_user_model()
+
+PERMISSION_VERSION_KEY = 'auth:perms:version'
+
+
+def permission_version():
+    """Current global permission version. Seeded from the clock so a lost key never reuses an old version."""
+    version = cache.get(PERMISSION_VERSION_KEY)
+    if version is None:
+        version = int(time.time())
+        if not cache.add(PERMISSION_VERSION_KEY, version, None):
+            version = cache.get(PERMISSION_VERSION_KEY, version)
+    return version
+
+
+async def apermission_version():
+    """Async version of permission_version()."""
+    version = await cache.aget(PERMISSION_VERSION_KEY)
+    if version is None:
+        version = int(time.time())
+        if not await cache.aadd(PERMISSION_VERSION_KEY, version, None):
+            version = await cache.aget(PERMISSION_VERSION_KEY, version)
+    return version
+
+
+def bump_permission_version():
+    """Invalidate every cached permission set when the current transaction commits."""
+    transaction.on_commit(_bump_permission_version)
+
+
+def _bump_permission_version():
+    try:
+        cache.incr(PERMISSION_VERSION_KEY)
+    except ValueError:
+        permission_version()
+
+
+def permission_cache_key(user_id, is_superuser):
+    return 'auth:perms:%s:%d' % (user_id, is_superuser)
+
+
+def invalidate_user_permissions(user_id):
+    """Invalidate one user's cached permission set when the current transaction commits."""
+    transaction.on_commit(lambda: _invalidate_user_permissions(user_id))
+
+
+def _invalidate_user_permissions(user_id):
+    version = permission_version()
+    cache.delete_many([permission_cache_key(user_id, su) for su in (False, True)], version=version)
+
+
+class CachingModelBackend(ModelBackend):
+    """
+    ModelBackend that loads the user's UserProfile in the same query as the user,
+    so role checks (relationship_app.roles.get_role) need no extra query per request,
+    and keeps each user's resolved permission set in the shared cache, so
+    permission_required costs a cache read instead of the user/group permission queries.
+    """
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        # ModelBackend.aauthenticate verifies the password on the event loop
+        # (acheck_password); used by the async login view, this keeps it in a thread.
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash once anyway, so unknown usernames take as long as wrong passwords (#20760).
+            await sync_to_async(make_password, thread_sensitive=False)(password)
+            return None
+        valid, must_update = await sync_to_async(verify_password, thread_sensitive=False)(
+            password, user.password
+        )
+        if not valid:
+            return None
+        if must_update:
+            # The stored hash predates the active PASSWORD_HASH_PROFILE: rehash it.
+            user.password = await sync_to_async(make_password, thread_sensitive=False)(password)
+            await user.asave(update_fields=['password'])
+        return user if self.user_can_authenticate(user) else None
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related('profile').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        try:
+            user = await UserModel._default_manager.select_related('profile').aget(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permission_cache_key(user_obj.pk, user_obj.is_superuser)
+            version = permission_version()
+            perms = cache.get(key, version=version)
+            if perms is None:
+                perms = super().get_all_permissions(user_obj)
+                cache.set(key, perms, getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 3600), version=version)
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
+
+    async def aget_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permission_cache_key(user_obj.pk, user_obj.is_superuser)
+            version = await apermission_version()
+            perms = await cache.aget(key, version=version)
+            if perms is None:
+                perms = await super().aget_all_permissions(user_obj)
+                await cache.aset(key, perms, getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 3600), version=version)
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
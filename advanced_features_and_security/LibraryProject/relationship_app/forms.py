@@ -4,6 +4,7 @@ use with ORM (no raw SQL) to prevent SQL injection and invalid data.
 """
 
 from django import forms
+from django.contrib.auth.forms import AuthenticationForm
 from .models import Book, Author
 
 
@@ -16,3 +17,14 @@ class BookForm(forms.ModelForm):
         widgets = {
             'title': forms.TextInput(attrs={'maxlength': 200}),
         }
+
+
+class LoginForm(AuthenticationForm):
+    """
+    AuthenticationForm that only validates the fields: the async login view checks the
+    credentials with aauthenticate(), which hashes off the event loop, instead of the
+    synchronous authenticate() that AuthenticationForm.clean() would call.
+    """
+
+    def clean(self):
+        return self.cleaned_data
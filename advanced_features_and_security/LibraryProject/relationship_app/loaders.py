@@ -0,0 +1,106 @@
+"""
+Request-scoped batching of the query_samples lookups, in the style of DataLoader.
+
+Code that looks up one name at a time (a loop, a template, several helpers) would run
+one query per name. A Loader collects the names instead:
+- load(name) returns a lazy result and only queues the name; using any result
+  (iterating it, len(), truth value, attributes) runs one batched query for every
+  name queued so far;
+- aload(name) queues the name and waits one event-loop turn, so coroutines that
+  load concurrently (asyncio.gather) share one batched query.
+Results are remembered for the rest of the request, so loading a name again is free.
+
+    loaders = get_loaders(request)
+    pending = {name: loaders.books_by_author.load(name) for name in names}
+    for name, books in pending.items():   # the first use runs the one query
+        ...
+
+get_loaders() memoizes the loaders on the request, so every part of the request
+shares them and nothing outlives it. This is a library: no view resolves names one at
+a time today (the catalog views read by pk or page), so nothing attaches loaders to
+requests by default. Call get_loaders(request) in the code that needs them.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.utils.functional import SimpleLazyObject
+
+from . import query_samples
+
+
+class Loader:
+    """Batches single-key loads into calls of `batch_fn(keys) -> {key: value}`."""
+
+    def __init__(self, batch_fn):
+        self.batch_fn = batch_fn
+        self._results = {}
+        self._queued = {}
+        self._batch = None
+
+    def _queue(self, key):
+        if key not in self._results:
+            self._queued[key] = None
+
+    def _take_queued(self):
+        keys, self._queued = list(self._queued), {}
+        return keys
+
+    def dispatch(self):
+        """Load every queued key now."""
+        keys = self._take_queued()
+        if keys:
+            self._results.update(self.batch_fn(keys))
+
+    def get(self, key):
+        """The value for `key`, loading it together with every queued key."""
+        if key not in self._results:
+            self._queue(key)
+            self.dispatch()
+        return self._results[key]
+
+    def load(self, key):
+        """
+        A lazy value for `key`. It behaves like the value once used, except that
+        `is None` and isinstance() checks see the proxy: test its truth value instead.
+        """
+        self._queue(key)
+        return SimpleLazyObject(lambda: self.get(key))
+
+    def load_many(self, keys):
+        return [self.load(key) for key in keys]
+
+    async def aload(self, key):
+        """The value for `key`, batched with the keys other coroutines load in the same turn."""
+        if key in self._results:
+            return self._results[key]
+        self._queue(key)
+        if self._batch is None:
+            # No batch is waiting to take keys (none, or one already loading): start one.
+            self._batch = asyncio.ensure_future(self._adispatch())
+        await asyncio.shield(self._batch)
+        return self._results[key]
+
+    async def _adispatch(self):
+        await asyncio.sleep(0)
+        self._batch = None
+        keys = self._take_queued()
+        if keys:
+            self._results.update(await sync_to_async(self.batch_fn)(keys))
+
+
+class Loaders:
+    """The loaders of one request."""
+
+    def __init__(self):
+        self.books_by_author = Loader(query_samples.query_books_by_authors)
+        self.books_in_library = Loader(query_samples.list_books_in_libraries)
+        self.librarian = Loader(query_samples.get_librarians_for_libraries)
+
+
+def get_loaders(request):
+    """The request's Loaders, created on first use."""
+    loaders = getattr(request, '_loaders', None)
+    if loaders is None:
+        loaders = request._loaders = Loaders()
+    return loaders
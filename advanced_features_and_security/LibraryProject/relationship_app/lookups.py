@@ -0,0 +1,186 @@
+"""
+Cached relationship lookups by name, built on the query_samples helpers.
+
+The query_samples helpers resolve a name and then query the relation: two round
+trips. These lookups remember name -> pk in two levels:
+1. a per-process LRU (NAME_CACHE_SIZE entries, each kept NAME_CACHE_TTL seconds);
+2. the shared cache (LOOKUP_CACHE_TIMEOUT), so other processes and restarts benefit.
+With the pk known, the result is one query on the foreign key; on a miss it is the
+helper's single joined query, and the pk is learned from its rows.
+
+Saving (e.g. renaming) or deleting an Author or Library (receivers in models.py) drops
+its entries from this process's LRU and bumps the model's version in the shared cache,
+which retires every shared entry for that model. Both happen when the change commits;
+before that, a concurrent lookup could cache the old name again. Other processes may use a renamed name
+until their LRU entry expires, so NAME_CACHE_TTL bounds that staleness. The counters
+from stats() are served at /metrics.
+"""
+
+from collections import Counter, OrderedDict
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+# Counts of local hits, shared hits and misses in this process.
+_stats = Counter()
+
+
+def _models():
+    from . import query_samples
+    from .models import Author, Book, Library, Librarian
+    return query_samples, Author, Book, Library, Librarian
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with a per-entry time-to-live."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard_value(self, value):
+        """Drop every key mapped to `value`."""
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if v == value]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LRUCache(getattr(settings, 'NAME_CACHE_SIZE', 1024), getattr(settings, 'NAME_CACHE_TTL', 60))
+
+
+def _version_key(model):
+    return 'relationship_app:names:version:%s' % model._meta.model_name
+
+
+def _shared_key(model, name):
+    digest = hashlib.md5(name.encode(), usedforsecurity=False).hexdigest()
+    return 'relationship_app:names:%s:%s' % (model._meta.model_name, digest)
+
+
+def name_version(model):
+    """Current name version of `model`. Seeded from the clock so a lost key never reuses an old version."""
+    key = _version_key(model)
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time())
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def cached_pk(model, name):
+    """The pk cached for `name`, or None. Counts local hits, shared hits and misses."""
+    entry = _local.get((model, name))
+    if entry is not None:
+        _stats['local'] += 1
+        return entry[1]
+    pk = cache.get(_shared_key(model, name), version=name_version(model))
+    if pk is not None:
+        _stats['shared'] += 1
+        _local.set((model, name), (model, pk))
+        return pk
+    _stats['miss'] += 1
+    return None
+
+
+def remember_pk(model, name, pk):
+    _local.set((model, name), (model, pk))
+    timeout = getattr(settings, 'LOOKUP_CACHE_TIMEOUT', 3600)
+    cache.set(_shared_key(model, name), pk, timeout, version=name_version(model))
+
+
+def forget(model, pk):
+    """Drop the cached names of the `model` row `pk` (renamed or deleted) when the current transaction commits."""
+    transaction.on_commit(lambda: _forget(model, pk))
+
+
+def _forget(model, pk):
+    _local.discard_value((model, pk))
+    try:
+        cache.incr(_version_key(model))
+    except ValueError:
+        name_version(model)
+
+
+def stats():
+    """Per-process counters: local hits, shared hits, misses and the overall hit ratio."""
+    total = sum(_stats.values())
+    hits = _stats['local'] + _stats['shared']
+    return {
+        'local_hits': _stats['local'], 'shared_hits': _stats['shared'], 'misses': _stats['miss'],
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def books_by_author(author_name):
+    """List of the author's books (with author joined), like query_books_by_author_alternative."""
+    query_samples, Author, Book, _, _ = _models()
+    pk = cached_pk(Author, author_name)
+    if pk is not None:
+        return list(Book.objects.with_author().filter(author_id=pk))
+    books = list(query_samples.query_books_by_author_alternative(author_name).with_author())
+    if len({book.author_id for book in books}) == 1:
+        remember_pk(Author, author_name, books[0].author_id)
+    return books
+
+
+def books_in_library(library_name):
+    """List of the library's books (with authors joined), like list_books_in_library_alternative."""
+    query_samples, _, Book, Library, _ = _models()
+    pk = cached_pk(Library, library_name)
+    if pk is not None:
+        return list(Book.objects.with_author().filter(libraries=pk))
+    books = list(
+        query_samples.list_books_in_library_alternative(library_name)
+        .with_author().annotate(library_pk=F('libraries'))  # reuses the filter's join
+    )
+    if len({book.library_pk for book in books}) == 1:
+        remember_pk(Library, library_name, books[0].library_pk)
+    return books
+
+
+def librarian_for_library(library_name):
+    """The library's Librarian or None, like get_librarian_for_library_alternative."""
+    _, _, _, Library, Librarian = _models()
+    pk = cached_pk(Library, library_name)
+    if pk is not None:
+        return Librarian.objects.filter(library_id=pk).first()
+    # Load the library with its librarian (if any), so the pk is learned either way.
+    libraries = list(Library.objects.filter(name=library_name).select_related('librarian')[:2])
+    if len(libraries) != 1:
+        return None
+    remember_pk(Library, library_name, libraries[0].pk)
+    try:
+        return libraries[0].librarian
+    except Librarian.DoesNotExist:
+        return None
@@ -0,0 +1,70 @@
+"""
+Measure the per-request cost of loading the user and checking permissions, with
+Django's ModelBackend and with CachingModelBackend (relationship_app/backends.py).
+
+    python manage.py benchmark_auth --requests 2000
+
+Each simulated request loads the user by id, resolves its role and runs the two
+permission checks a catalog page makes (permission_required, then the page cache
+key), on a fresh user object as a new request would. The user, in a group holding
+every relationship_app and bookshelf permission, is created inside a transaction
+that is rolled back at the end. Times are per request; queries are averaged.
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from LibraryProject.benchmarking import mean_of, rolled_back
+from relationship_app import roles
+from relationship_app.backends import CachingModelBackend
+
+PERMISSION = 'relationship_app.can_view'
+
+
+class Command(BaseCommand):
+    help = 'Report the per-request cost of user loading and permission checks per auth backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Simulated requests per backend.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1.')
+        with rolled_back():
+            user = get_user_model().objects.create_user('benchmark-auth', password=None)
+            group = Group.objects.create(name='benchmark-auth')
+            group.permissions.set(Permission.objects.filter(
+                content_type__app_label__in=['relationship_app', 'bookshelf'],
+            ))
+            user.groups.add(group)
+            for name, backend, load_role in (
+                # Before: the profile was read by its own query on each request.
+                ('ModelBackend', ModelBackend(), roles._load_role),
+                ('CachingModelBackend', CachingModelBackend(), roles.get_role),
+            ):
+                self.report(name, backend, load_role, user.pk, options['requests'])
+
+    def report(self, name, backend, load_role, user_id, requests):
+        def request():
+            user = backend.get_user(user_id)
+            load_role(user)
+            # permission_required, then the page cache key.
+            backend.has_perm(user, PERMISSION)
+            backend.get_all_permissions(user)
+
+        queries = 0
+
+        def count(execute, *args):
+            nonlocal queries
+            queries += 1
+            return execute(*args)
+
+        request()  # Warm the caches, as every request after a user's first one finds them.
+        with connection.execute_wrapper(count):
+            per_request = mean_of(request, requests)
+        self.stdout.write('%-20s %8.1f us/request  %4.1f queries/request' % (
+            name, per_request, queries / requests,
+        ))
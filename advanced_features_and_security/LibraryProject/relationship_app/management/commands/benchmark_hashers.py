@@ -0,0 +1,54 @@
+"""
+Measure password verifications (logins) per second per core for each PASSWORD_HASH_PROFILE.
+
+    python manage.py benchmark_hashers --seconds 3
+
+Use it to choose a profile: the cost should be as high as the login rate you need allows.
+Profiles whose hasher library is not installed (argon2-cffi) are reported and skipped.
+"""
+
+import time
+
+from django.contrib.auth.hashers import get_hasher, make_password, verify_password
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = 'Report logins/second per core for each password-hash profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('profiles', nargs='*', help='Default: every profile in PASSWORD_HASH_PROFILES.')
+        parser.add_argument('--seconds', type=float, default=2.0, help='Time spent per profile.')
+
+    def handle(self, *args, **options):
+        profiles = options['profiles'] or list(settings.PASSWORD_HASH_PROFILES)
+        unknown = set(profiles) - settings.PASSWORD_HASH_PROFILES.keys()
+        if unknown:
+            raise CommandError('Unknown profile(s): %s' % ', '.join(sorted(unknown)))
+        for name in profiles:
+            profile = settings.PASSWORD_HASH_PROFILES[name]
+            # Put the profile's hasher first, as settings.py does for the active profile.
+            hashers = sorted(
+                settings.PASSWORD_HASHERS,
+                key=lambda path: getattr(import_string(path), 'profile_hasher', None) != profile['hasher'],
+            )
+            with override_settings(PASSWORD_HASH_PROFILE=name, PASSWORD_HASHERS=hashers):
+                try:
+                    rate = self.measure(options['seconds'])
+                except (ImportError, ValueError) as e:
+                    self.stderr.write('%-12s skipped: %s' % (name, e))
+                    continue
+                self.stdout.write('%-12s %s  %8.1f logins/s per core' % (name, get_hasher().algorithm, rate))
+
+    def measure(self, seconds):
+        encoded = make_password('benchmark-password')
+        count, started = 0, time.perf_counter()
+        while True:
+            verify_password('benchmark-password', encoded)
+            count += 1
+            elapsed = time.perf_counter() - started
+            if elapsed >= seconds:
+                return count / elapsed
@@ -0,0 +1,143 @@
+"""
+Load-test running servers, e.g. the ASGI deployment (uvicorn) against the WSGI one.
+
+    uvicorn LibraryProject.asgi:application --port 8001 --workers 4
+    gunicorn LibraryProject.wsgi:application --bind 127.0.0.1:8002 --workers 4 --threads 8
+    python manage.py benchmark_load asgi=http://127.0.0.1:8001 wsgi=http://127.0.0.1:8002 \\
+        --username admin --concurrency 64 --seconds 10
+
+Start the servers with the same settings and database as this command. Each target gets
+--concurrency keep-alive connections that request the --path pages in turn for
+--seconds; requests/second, latency percentiles and non-200 responses are reported.
+
+The catalog pages need a user with the view permissions: --username names one, for
+whom a session is created in the database and deleted at the end. Requests carry
+X-Forwarded-Proto: https (SECURE_PROXY_SSL_HEADER), as behind the TLS proxy of
+DEPLOYMENT.md, so SECURE_SSL_REDIRECT does not answer them with redirects.
+"""
+
+import asyncio
+from importlib import import_module
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ('/books/', '/bookshelf/')
+
+
+async def fetch(reader, writer, request):
+    """Send one request on a keep-alive connection; return (status, keep_alive)."""
+    writer.write(request)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+    headers = {name.strip().lower(): value.strip() for name, value in headers.items()}
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+        return status, headers.get('connection', '').lower() != 'close'
+    await reader.read()
+    return status, False
+
+
+async def client(url, requests, deadline, results):
+    """One connection: request the pages in turn until the deadline, reconnecting as needed."""
+    writer = None
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+            started = time.perf_counter()
+            status, keep_alive = await fetch(reader, writer, requests[i % len(requests)])
+            results.append((status, time.perf_counter() - started))
+            i += 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def run_load(url, requests, concurrency, seconds):
+    results = []
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(client(url, requests, deadline, results) for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Report requests/second and latency of running servers (e.g. uvicorn against WSGI).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='NAME=URL of a running server, e.g. asgi=http://127.0.0.1:8001.')
+        parser.add_argument('--path', action='append', dest='paths', help='Page to request (repeatable).')
+        parser.add_argument('--username', help='Request the pages as this user (needs the view permissions).')
+        parser.add_argument('--concurrency', type=int, default=32, help='Connections per target.')
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration per target.')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            name, sep, url = target.rpartition('=')
+            url = urlsplit(url if sep else target)
+            if url.scheme != 'http' or not url.hostname:
+                raise CommandError('Expected NAME=http://host:port, got %r.' % target)
+            targets.append((name or url.netloc, url))
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1.')
+
+        session = self.create_session(options['username']) if options['username'] else None
+        try:
+            for name, url in targets:
+                requests = [self.build_request(url, path, session) for path in options['paths'] or DEFAULT_PATHS]
+                results, elapsed = asyncio.run(run_load(url, requests, options['concurrency'], options['seconds']))
+                self.report(name, results, elapsed)
+        finally:
+            if session is not None:
+                session.delete()
+
+    def create_session(self, username):
+        """A logged-in session for `username`, as django.contrib.auth.login() would store it."""
+        try:
+            user = get_user_model()._default_manager.get_by_natural_key(username)
+        except get_user_model().DoesNotExist:
+            raise CommandError('Unknown user %r.' % username)
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session
+
+    def build_request(self, url, path, session):
+        lines = [
+            'GET %s HTTP/1.1' % path,
+            'Host: %s' % url.netloc,
+            'X-Forwarded-Proto: https',
+            'Connection: keep-alive',
+        ]
+        if session is not None:
+            lines.append('Cookie: %s=%s' % (settings.SESSION_COOKIE_NAME, session.session_key))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    def report(self, name, results, elapsed):
+        if not results:
+            self.stdout.write('%-10s no responses' % name)
+            return
+        latencies = sorted(duration for _, duration in results)
+        errors = sum(status != 200 for status, _ in results)
+        self.stdout.write('%-10s %8.1f requests/s  p50 %7.1f ms  p99 %7.1f ms  %d non-200 of %d' % (
+            name, len(results) / elapsed, percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000, errors, len(results),
+        ))
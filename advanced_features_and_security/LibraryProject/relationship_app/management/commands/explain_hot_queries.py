@@ -0,0 +1,87 @@
+"""
+Run EXPLAIN on the project's hot queries and flag the ones that scan a whole table.
+
+    python manage.py explain_hot_queries [--verbose-plans] [--fail-on-scan]
+
+Plans are read for SQLite ("SCAN <table>" without an index) and PostgreSQL ("Seq Scan");
+other backends get their plans printed without a verdict. PostgreSQL may prefer a
+sequential scan on tiny tables even when an index exists, so check it with real data.
+"""
+
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from bookshelf.models import Book as ShelfBook
+from bookshelf.search import fts_available, fts_matches, search_books
+from relationship_app import query_samples
+from relationship_app.models import (
+    Author, Book, CatalogEntry, Library, Librarian, LibrarySnapshot, UserProfile,
+)
+
+PAGE_SIZE = 50
+SAMPLE = 'sample'
+
+# (label, queryset factory). Keep in sync with the lookups the views and query_samples run.
+HOT_QUERIES = [
+    ('author by name', lambda: Author.objects.filter(name=SAMPLE)),
+    ('books by author name', lambda: query_samples.query_books_by_author_alternative(SAMPLE)),
+    ('books by author name, any case', lambda: query_samples.query_books_by_author_case_insensitive(SAMPLE)),
+    ('library by name', lambda: Library.objects.filter(name=SAMPLE)),
+    ('books in library by name', lambda: query_samples.list_books_in_library_alternative(SAMPLE)),
+    ('librarian by library name', lambda: Librarian.objects.filter(library__name=SAMPLE)),
+    ('list_books page', lambda: CatalogEntry.objects.order_by('title', 'pk')[:PAGE_SIZE]),
+    ('library_detail snapshot', lambda: LibrarySnapshot.objects.filter(pk=1)),
+    ('library snapshot rebuild', lambda: Book.objects.filter(libraries=1).values_list('title', 'author__name')),
+    ('users by role', lambda: UserProfile.objects.filter(role='Librarian').values_list('user_id', flat=True)),
+    ('book_list page', lambda: ShelfBook.objects.order_by('title', 'pk')[:PAGE_SIZE]),
+    # The index path, whether or not SAMPLE matches (search_books scans when nothing does).
+    ('book_list search', lambda: (
+        fts_matches(SAMPLE, ShelfBook.objects.all()) if fts_available() else search_books(SAMPLE)
+    )[:PAGE_SIZE]),
+    ('bookshelf books by author', lambda: ShelfBook.objects.filter(author=SAMPLE)),
+    ('import natural-key lookup', lambda: ShelfBook.objects.filter(title__in=[SAMPLE, SAMPLE + '2'])),
+]
+
+# A table scan without an index: SQLite "SCAN t" (but not "SCAN t USING [COVERING] INDEX"
+# or an FTS "VIRTUAL TABLE"), PostgreSQL "Seq Scan on t".
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'\bSCAN (\w+)\b(?!.*(?:USING|VIRTUAL TABLE))'),
+    'postgresql': re.compile(r'\bSeq Scan on (\w+)'),
+}
+
+
+def full_scans(plan, vendor=None):
+    """Tables read by a full scan in an EXPLAIN plan, or None if the vendor is not understood."""
+    pattern = FULL_SCAN_PATTERNS.get(vendor or connection.vendor)
+    if pattern is None:
+        return None
+    return sorted({match.group(1) for line in plan.splitlines() for match in pattern.finditer(line)})
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the project's hot queries and report the ones doing full table scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only flagged ones.')
+        parser.add_argument('--fail-on-scan', action='store_true', help='Exit with an error if any query scans.')
+
+    def handle(self, *args, **options):
+        flagged = []
+        for label, make_queryset in HOT_QUERIES:
+            plan = make_queryset().explain()
+            scans = full_scans(plan)
+            if scans is None:
+                self.stdout.write('?    %s' % label)
+            elif scans:
+                flagged.append(label)
+                self.stdout.write(self.style.WARNING('SCAN %s: %s' % (label, ', '.join(scans))))
+            else:
+                self.stdout.write(self.style.SUCCESS('ok   %s' % label))
+            if options['verbose_plans'] or scans:
+                self.stdout.write('\n'.join('       ' + line for line in plan.splitlines()))
+        if flagged and options['fail_on_scan']:
+            raise CommandError('%d hot quer%s a whole table: %s' % (
+                len(flagged), 'y scans' if len(flagged) == 1 else 'ies scan', '; '.join(flagged)
+            ))
@@ -0,0 +1,36 @@
+"""
+Stream a catalog to a file or stdout as CSV or JSONL, optionally gzip-compressed.
+
+    python manage.py export_catalog relationship_app --format jsonl --gzip -o books.jsonl.gz
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand
+
+from LibraryProject.export import CATALOGS, CHUNK_SIZE, FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = 'Export a book catalog as CSV or JSONL with constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('catalog', choices=sorted(CATALOGS))
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip.')
+        parser.add_argument('-o', '--output', help='Output file (default: stdout).')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunks = export_stream(
+            options['catalog'], options['format'], options['gzip'], options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
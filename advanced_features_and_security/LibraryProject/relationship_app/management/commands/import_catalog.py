@@ -0,0 +1,36 @@
+"""
+Bulk-import a catalog from CSV or JSONL (optionally .gz), e.g. a file from export_catalog.
+
+    python manage.py import_catalog relationship_app books.jsonl.gz --batch-size 2000
+
+Re-running with the same file is safe: books are upserted by natural key.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from LibraryProject.export import FORMATS
+from LibraryProject.importer import BATCH_SIZE, IMPORTERS, import_catalog, open_rows
+
+
+class Command(BaseCommand):
+    help = 'Import a book catalog with batched bulk inserts, reporting rows/second.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('catalog', choices=sorted(IMPORTERS))
+        parser.add_argument('path', help='CSV or JSONL file; gzip if it ends in .gz.')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        progress = self.report_progress if options['verbosity'] > 1 else None
+        try:
+            rows = open_rows(options['path'], options['format'])
+            stats = import_catalog(options['catalog'], rows, options['batch_size'], progress)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS('Imported %s' % stats))
+
+    def report_progress(self, stats):
+        self.stderr.write(str(stats))
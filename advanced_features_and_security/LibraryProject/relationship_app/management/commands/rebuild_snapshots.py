@@ -0,0 +1,37 @@
+"""
+Rebuild the materialized catalog read models (relationship_app/snapshots.py).
+
+    python manage.py rebuild_snapshots            # every CatalogEntry and LibrarySnapshot
+    python manage.py rebuild_snapshots --stale    # only library snapshots marked stale
+
+Normally unnecessary: entries follow every change and stale library snapshots are
+rebuilt on their next read. Use it after writes that bypass signals, or to warm pages.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from LibraryProject import routers
+from relationship_app import snapshots
+from relationship_app.models import Library, LibrarySnapshot
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the flat catalog entries and the per-library snapshots.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale', action='store_true', help='Only rebuild stale library snapshots.')
+
+    def handle(self, *args, **options):
+        with routers.pin_to_primary():
+            if options['stale']:
+                library_ids = list(
+                    LibrarySnapshot.objects.filter(built_version__lt=F('version')).values_list('pk', flat=True)
+                )
+            else:
+                snapshots.rebuild_entries()
+                self.stdout.write('Rebuilt catalog entries.')
+                library_ids = list(Library.objects.values_list('pk', flat=True))
+            for library_id in library_ids:
+                snapshots.build_library_snapshot(library_id)
+        self.stdout.write(self.style.SUCCESS('Rebuilt %d library snapshot(s).' % len(library_ids)))
@@ -0,0 +1,37 @@
+"""
+Copy the primary SQLite database into the SQLite files configured as read replicas.
+
+    DJANGO_DB_REPLICAS=replica1.sqlite3,replica2.sqlite3 python manage.py sync_sqlite_replicas
+
+For local testing of replica routing only: SQLite has no replication, so the copies
+are snapshots that lag behind the primary until the command is run again.
+"""
+
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Snapshot the primary SQLite database into each SQLite read replica.'
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('The primary database is not SQLite; use real replication.')
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if not replicas:
+            raise CommandError('No replicas configured (DJANGO_DB_REPLICAS).')
+        primary.ensure_connection()
+        for alias in replicas:
+            connections[alias].close()
+            path = connections[alias].settings_dict['NAME']
+            target = sqlite3.connect(path)
+            try:
+                # The online backup API gives a consistent copy even while the primary is written.
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS('%s: copied to %s' % (alias, path)))
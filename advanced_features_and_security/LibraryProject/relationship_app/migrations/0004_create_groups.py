@@ -11,7 +11,9 @@ from django.contrib.contenttypes.models import ContentType
 
 def create_groups(apps, schema_editor):
     """Create permissions for Book (if missing), then create groups and assign permissions."""
-    content_type = ContentType.objects.get(app_label='relationship_app', model='book')
+    # On a fresh database (e.g. the test database) content types are only created by
+    # post_migrate, after every migration has run.
+    content_type, _ = ContentType.objects.get_or_create(app_label='relationship_app', model='book')
 
     def get_or_create_perm(codename, name):
         perm, _ = Permission.objects.get_or_create(
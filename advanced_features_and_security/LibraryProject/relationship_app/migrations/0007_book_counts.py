@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_books(apps, schema_editor):
+    """Fill the new counters with one UPDATE per table."""
+    db = schema_editor.connection.alias
+    Author = apps.get_model('relationship_app', 'Author')
+    Book = apps.get_model('relationship_app', 'Book')
+    Library = apps.get_model('relationship_app', 'Library')
+    Through = Library.books.through
+    books = Book.objects.using(db).filter(author=OuterRef('pk')).order_by().values('author')
+    links = Through.objects.using(db).filter(library=OuterRef('pk')).order_by().values('library')
+    Author.objects.using(db).update(book_count=Coalesce(Subquery(books.annotate(n=Count('pk')).values('n')), 0))
+    Library.objects.using(db).update(book_count=Coalesce(Subquery(links.annotate(n=Count('pk')).values('n')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship_app', '0006_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='library',
+            name='book_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_books, migrations.RunPython.noop),
+    ]
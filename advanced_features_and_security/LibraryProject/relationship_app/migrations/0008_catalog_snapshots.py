@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_catalog_entries(apps, schema_editor):
+    """One CatalogEntry per existing book; library snapshots are built on first read."""
+    db = schema_editor.connection.alias
+    Book = apps.get_model('relationship_app', 'Book')
+    CatalogEntry = apps.get_model('relationship_app', 'CatalogEntry')
+    rows = Book.objects.using(db).order_by().values_list(
+        'pk', 'title', 'author_id', 'author__name', 'author__book_count'
+    )
+    batch = []
+    for book_id, title, author_id, author_name, book_count in rows.iterator(chunk_size=2000):
+        batch.append(CatalogEntry(
+            book_id=book_id, title=title, author_id=author_id,
+            author_name=author_name, author_book_count=book_count,
+        ))
+        if len(batch) >= 2000:
+            CatalogEntry.objects.using(db).bulk_create(batch)
+            batch = []
+    CatalogEntry.objects.using(db).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relationship_app', '0007_book_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibrarySnapshot',
+            fields=[
+                ('library', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='relationship_app.library')),
+                ('name', models.CharField(max_length=150)),
+                ('book_count', models.PositiveIntegerField(default=0)),
+                ('data', models.TextField(default='[]')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('built_version', models.PositiveIntegerField(default=0)),
+                ('built_at', models.DateTimeField(null=True)),
+                ('stale_since', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_entry', serialize=False, to='relationship_app.book')),
+                ('title', models.CharField(max_length=200)),
+                ('author_name', models.CharField(max_length=100)),
+                ('author_book_count', models.PositiveIntegerField(default=0)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='relationship_app.author')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['title', 'book'], name='rel_catalogentry_title_idx')],
+            },
+        ),
+        migrations.RunPython(fill_catalog_entries, migrations.RunPython.noop),
+    ]
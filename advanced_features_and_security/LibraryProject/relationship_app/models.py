@@ -1,20 +1,83 @@
+from collections import Counter, defaultdict, namedtuple
+import json
+
 from django.db import models
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group, Permission
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest, Lower
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
+from LibraryProject import catalog_cache, changes
+
+from . import lookups, snapshots
+from .backends import bump_permission_version, invalidate_user_permissions
+from .roles import invalidate_role, invalidate_roles
+
 # Create your models here.
 
 User = get_user_model()
 
-class Author(models.Model):
+def _recount(queryset, actual):
+    """Set book_count to `actual` where it differs; returns the number of rows fixed."""
+    drifted = list(queryset.alias(actual=actual).exclude(book_count=F('actual')).values_list('pk', flat=True))
+    if drifted:
+        queryset.model._default_manager.filter(pk__in=drifted).update(book_count=actual)
+    return len(drifted)
+
+
+class CountedModel(models.Model):
+    """
+    A model with a book_count column maintained by atomic F() updates (receivers below).
+    save() never writes book_count, so saving a stale instance cannot undo those updates.
+    """
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'book_count'
+            ]
+        super().save(*args, **kwargs)
+
+
+class AuthorQuerySet(models.QuerySet):
+    def recount(self):
+        """Repair book_count drift (e.g. after raw SQL or bulk_create); returns rows fixed."""
+        books = Book.objects.filter(author=OuterRef('pk')).order_by().values('author').annotate(n=Count('pk'))
+        return _recount(self, Coalesce(Subquery(books.values('n')), 0))
+
+
+class Author(CountedModel):
     name = models.CharField(max_length=100)
 
+    objects = AuthorQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Exact-name lookups (query_samples) and case-insensitive ones on lower(name).
+            models.Index(fields=['name'], name='rel_author_name_idx'),
+            models.Index(Lower('name'), name='rel_author_name_lower_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
 
+class BookQuerySet(models.QuerySet):
+    """Reusable Book queries that load related rows in bulk instead of per book."""
+
+    def with_author(self):
+        """Join the author in the same query, for templates that render book.author.name."""
+        return self.select_related('author')
+
+
 class Book(models.Model):
     """
     Book model with custom permissions for access control.
@@ -23,6 +86,8 @@ class Book(models.Model):
     title = models.CharField(max_length=200)
     author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name="books")
 
+    objects = BookQuerySet.as_manager()
+
     class Meta:
         permissions = [
             ('can_view', 'Can view'),
@@ -30,15 +95,40 @@ class Book(models.Model):
             ('can_edit', 'Can edit'),
             ('can_delete', 'Can delete'),
         ]
+        indexes = [
+            # Backs keyset pagination over (title, pk) in list_books.
+            models.Index(fields=['title', 'id'], name='rel_book_title_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.author.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The author the row had when loaded, so a reassignment can move the count.
+        instance._loaded_author_id = instance.__dict__.get('author_id')
+        return instance
+
+
+class LibraryQuerySet(models.QuerySet):
+    def recount(self):
+        """Repair book_count drift (e.g. after raw SQL or bulk_create); returns rows fixed."""
+        links = Library.books.through.objects.filter(library=OuterRef('pk')).order_by().values('library')
+        return _recount(self, Coalesce(Subquery(links.annotate(n=Count('pk')).values('n')), 0))
 
-class Library(models.Model):
+
+class Library(CountedModel):
     name = models.CharField(max_length=150)
     books = models.ManyToManyField(Book, related_name="libraries")
 
+    objects = LibraryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='rel_library_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -51,7 +141,75 @@ class Librarian(models.Model):
         return f"{self.name} ({self.library.name})"
 
 
+class CatalogEntry(models.Model):
+    """
+    Denormalized read model of one book for list_books: title and author columns in
+    one row, so a page is a single index range scan with no join. Kept in step by the
+    receivers below; rebuilt by `manage.py rebuild_snapshots`.
+    """
+    book = models.OneToOneField(Book, primary_key=True, on_delete=models.CASCADE, related_name='catalog_entry')
+    title = models.CharField(max_length=200)
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='+')
+    author_name = models.CharField(max_length=100)
+    author_book_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['title', 'book'], name='rel_catalogentry_title_idx'),
+        ]
+
+
+class LibrarySnapshot(models.Model):
+    """
+    Materialized library page: the library's name and its books as one compact JSON
+    array of [book id, title, author id, author name], ordered by title. A change marks
+    it stale by bumping `version`; it is rebuilt (snapshots.py) on the next read or by
+    `manage.py rebuild_snapshots`, and is current while built_version == version.
+    """
+    library = models.OneToOneField(Library, primary_key=True, on_delete=models.CASCADE, related_name='snapshot')
+    name = models.CharField(max_length=150)
+    book_count = models.PositiveIntegerField(default=0)
+    data = models.TextField(default='[]')
+    version = models.PositiveIntegerField(default=0)
+    built_version = models.PositiveIntegerField(default=0)
+    built_at = models.DateTimeField(null=True)
+    stale_since = models.DateTimeField(null=True)
+
+    @property
+    def is_stale(self):
+        return self.built_version < self.version
+
+    @property
+    def books(self):
+        return [SnapshotBook(*row) for row in json.loads(self.data)]
+
+
+SnapshotBook = namedtuple('SnapshotBook', 'id title author_id author_name')
+
+
+class UserProfileManager(models.Manager):
+    def bulk_create_for_users(self, users, role=None, batch_size=None):
+        """
+        Create profiles for many users with one INSERT per batch (e.g. after
+        User.objects.bulk_create, which sends no post_save). Users that already
+        have a profile are skipped.
+        """
+        role = role or self.model._meta.get_field('role').default
+        profiles = self.bulk_create(
+            [self.model(user_id=user.pk, role=role) for user in users],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        # bulk_create sends no post_save, so drop any role cached for these users.
+        invalidate_roles([user.pk for user in users])
+        return profiles
+
+
 class UserProfile(models.Model):
+    """
+    Role of a user. Tracks which fields changed since it was loaded, so save()
+    writes only those fields and does nothing when none changed.
+    """
     ROLE_CHOICES = [
         ('Admin', 'Admin'),
         ('Librarian', 'Librarian'),
@@ -61,19 +219,295 @@ class UserProfile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='profile')
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='Member')
 
+    objects = UserProfileManager()
+
+    class Meta:
+        indexes = [
+            # "Users with role X" is answered from the index alone.
+            models.Index(fields=['role', 'user'], name='rel_userprofile_role_user_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.role}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # arefresh_from_db() calls this too. The reloaded values are the new baseline:
+        # without this, setting a field back to its first-loaded value would look unchanged.
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._snapshot(fields)
+
+    def _snapshot(self, fields=None):
+        """Record the current values as loaded (all fields, or only `fields`)."""
+        if fields is None:
+            self._loaded_values = {}
+            names = [f.attname for f in self._meta.concrete_fields]
+        else:
+            names = [self._meta.get_field(name).attname for name in fields]
+        deferred = self.get_deferred_fields()
+        self._loaded_values.update(
+            (name, getattr(self, name)) for name in names if name not in deferred
+        )
+
+    def get_dirty_fields(self):
+        """Names of fields whose value differs from what was loaded or last saved."""
+        loaded = getattr(self, '_loaded_values', {})
+        return [
+            f.name for f in self._meta.concrete_fields
+            if f.attname in loaded and getattr(self, f.attname) != loaded[f.attname]
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and hasattr(self, '_loaded_values'):
+            dirty = self.get_dirty_fields()
+            if not dirty:
+                return
+            kwargs['update_fields'] = dirty
+        super().save(*args, **kwargs)
+        self._snapshot()
+
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    """Signal to automatically create UserProfile when a new user is registered."""
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal to automatically create UserProfile when a new user is registered.
+    Only on creation: later User saves (e.g. last_login on every login) don't touch the profile.
+    """
+    if created and not raw:
+        instance.profile = UserProfile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_cached_role(sender, instance, **kwargs):
+    """Drop the user's cached role (see roles.py) whenever their profile changes."""
+    invalidate_role(instance.user_id)
+
+
+# Cached permission sets (see backends.py): drop one user's entry when their own
+# groups/permissions change, and retire all entries when a group or permission changes.
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permission_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate cached permissions of the users whose groups/permissions changed."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_user_permissions(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            invalidate_user_permissions(user_id)
+    else:
+        # e.g. group.user_set.clear(): the affected users are unknown.
+        bump_permission_version()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permission_cache(sender, action, **kwargs):
+    """A group's permissions changed: invalidate every cached permission set."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_permission_version()
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_all_permission_caches(sender, **kwargs):
+    """A group or permission was changed or removed: invalidate every cached permission set."""
+    bump_permission_version()
+
+
+# Cached catalog pages (LibraryProject/catalog_cache.py): list_books depends on the
+# 'relationship_app:books' scope, each library page also on its own library scope.
+# The JSON API (LibraryProject/api.py) also depends on 'relationship_app:libraries',
+# bumped by any change to libraries, their book lists or librarians.
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_cached_book_pages(sender, **kwargs):
+    """A book or author changed: invalidate the book list and every library page."""
+    catalog_cache.bump('relationship_app:books')
+
+
+@receiver(post_save, sender=Library)
+@receiver(post_delete, sender=Library)
+def invalidate_cached_library_page(sender, instance, **kwargs):
+    """A library was renamed or removed: invalidate its page."""
+    catalog_cache.bump('relationship_app:library:%s' % instance.pk, 'relationship_app:libraries')
+
+
+@receiver(post_save, sender=Librarian)
+@receiver(post_delete, sender=Librarian)
+def invalidate_cached_librarians(sender, **kwargs):
+    catalog_cache.bump('relationship_app:libraries')
+
+
+@receiver(m2m_changed, sender=Library.books.through)
+def invalidate_cached_library_books(sender, instance, action, reverse, pk_set, **kwargs):
+    """Books were added to or removed from libraries: invalidate those libraries' pages."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    catalog_cache.bump('relationship_app:libraries')
+    if not reverse:
+        catalog_cache.bump('relationship_app:library:%s' % instance.pk)
+    elif pk_set:
+        catalog_cache.bump(*['relationship_app:library:%s' % pk for pk in pk_set])
+    else:
+        # book.libraries.clear(): the affected libraries are unknown.
+        catalog_cache.bump('relationship_app:books')
+
+
+# Change times for conditional GET (LibraryProject/changes.py).
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Library)
+@receiver(post_delete, sender=Library)
+@receiver(post_save, sender=Librarian)
+@receiver(post_delete, sender=Librarian)
+def touch_changed_model(sender, **kwargs):
+    changes.touch(sender)
+
+
+@receiver(m2m_changed, sender=Library.books.through)
+def touch_changed_library_books(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        changes.touch(Library)
+
+
+# Denormalized book counts (Author.book_count, Library.book_count), kept exact with
+# atomic F() updates. Bulk operations send no signals: they call recount() instead,
+# and `manage.py recount` repairs any other drift.
+def _add_to_counts(model, ids, sign, using):
+    """
+    Add sign * (occurrences of pk in ids) to each row's book_count, one UPDATE per amount.
+    Counts never go below 0: a counter that drifted low (rows written without signals)
+    must not make the delete that decrements it fail.
+    """
+    by_amount = defaultdict(list)
+    for pk, n in Counter(ids).items():
+        by_amount[n].append(pk)
+    for n, pks in by_amount.items():
+        model._default_manager.using(using).filter(pk__in=pks).update(
+            book_count=Greatest(F('book_count') + sign * n, 0)
+        )
+        if model is Author:
+            CatalogEntry.objects.using(using).filter(author__in=pks).update(
+                author_book_count=Greatest(F('author_book_count') + sign * n, 0)
+            )
+
+
+@receiver(post_save, sender=Book)
+def count_book_for_author(sender, instance, created, raw=False, using=None, **kwargs):
+    """A new book counts for its author; a reassigned book moves to the new author."""
+    if raw:
+        return
+    old_author_id = getattr(instance, '_loaded_author_id', None)
     if created:
-        UserProfile.objects.create(user=instance)
+        _add_to_counts(Author, [instance.author_id], 1, using)
+    elif old_author_id is not None and old_author_id != instance.author_id:
+        _add_to_counts(Author, [old_author_id], -1, using)
+        _add_to_counts(Author, [instance.author_id], 1, using)
+    instance._loaded_author_id = instance.author_id
 
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Signal to save UserProfile when User is saved."""
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
\ No newline at end of file
+@receiver(pre_delete, sender=Book)
+def remember_book_libraries(sender, instance, using=None, **kwargs):
+    """The cascade deletes library links without m2m_changed: note them first."""
+    instance._library_ids = list(
+        Library.books.through.objects.using(using).filter(book=instance).values_list('library_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Book)
+def uncount_deleted_book(sender, instance, using=None, **kwargs):
+    _add_to_counts(Author, [instance.author_id], -1, using)
+    _add_to_counts(Library, getattr(instance, '_library_ids', []), -1, using)
+
+
+def _existing_links(through, instance, reverse, pk_set, using):
+    """Library ids (one per link) of the links a remove/clear is about to delete."""
+    links = through.objects.using(using)
+    if reverse:
+        links = links.filter(book_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(library_id__in=pk_set)
+    else:
+        links = links.filter(library_id=instance.pk)
+        if pk_set is not None:
+            links = links.filter(book_id__in=pk_set)
+    return list(links.values_list('library_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Library.books.through)
+def count_library_books(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    """
+    Keep Library.book_count in step with library.books / book.libraries changes, and
+    mark the changed libraries' snapshots stale (see snapshots.py).
+    """
+    if action == 'post_add':
+        # pk_set holds only the links actually created.
+        ids = list(pk_set) if reverse else [instance.pk] * len(pk_set)
+        _add_to_counts(Library, ids, 1, using)
+        snapshots.mark_stale(set(ids), using)
+    elif action in ('pre_remove', 'pre_clear'):
+        # remove() may name books that are not linked: count the real links.
+        instance._removed_library_ids = _existing_links(sender, instance, reverse, pk_set, using)
+    elif action in ('post_remove', 'post_clear'):
+        ids = instance.__dict__.pop('_removed_library_ids', [])
+        _add_to_counts(Library, ids, -1, using)
+        snapshots.mark_stale(set(ids), using)
+
+
+# Materialized read models (CatalogEntry, LibrarySnapshot; see snapshots.py). These
+# receivers run after the count receivers above, so they copy up-to-date counts.
+@receiver(post_save, sender=Book)
+def refresh_book_snapshots(sender, instance, raw=False, using=None, **kwargs):
+    """Upsert the book's CatalogEntry and mark the pages of its libraries stale."""
+    if raw:
+        return
+    snapshots.refresh_entry(instance, using)
+    snapshots.mark_stale(Library.objects.using(using).filter(books=instance), using)
+
+
+@receiver(post_delete, sender=Book)
+def mark_deleted_book_snapshots(sender, instance, using=None, **kwargs):
+    """The CatalogEntry goes with the book (CASCADE); its libraries' pages are stale."""
+    snapshots.mark_stale(getattr(instance, '_library_ids', []), using)
+
+
+@receiver(post_save, sender=Author)
+def refresh_author_snapshots(sender, instance, created, raw=False, using=None, **kwargs):
+    """A renamed author: rewrite the name in its entries and mark its libraries stale."""
+    if created or raw:
+        return
+    CatalogEntry.objects.using(using).filter(author=instance).update(author_name=instance.name)
+    snapshots.mark_stale(Library.objects.using(using).filter(books__author=instance), using)
+
+
+@receiver(post_save, sender=Library)
+def mark_library_snapshot(sender, instance, created, raw=False, using=None, **kwargs):
+    if not created and not raw:
+        snapshots.mark_stale([instance.pk], using)
+
+
+# Cached name -> pk lookups (see lookups.py).
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Library)
+def forget_saved_names(sender, instance, created, raw=False, **kwargs):
+    """A saved row may have been renamed: its old name must not resolve to it any more."""
+    if not created:
+        lookups.forget(sender, instance.pk)
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Library)
+def forget_deleted_names(sender, instance, **kwargs):
+    lookups.forget(sender, instance.pk)
@@ -3,8 +3,12 @@ Sample queries demonstrating Django ORM relationships:
 - ForeignKey: Query all books by a specific author
 - ManyToMany: List all books in a library
 - OneToOne: Retrieve the librarian for a library
+Each has a batched variant for many names, answered in a constant number of queries.
 """
 
+from django.db.models import Prefetch
+from django.db.models.functions import Lower
+
 from relationship_app.models import Author, Book, Library, Librarian
 
 
@@ -38,6 +42,19 @@ def query_books_by_author_alternative(author_name):
     return books
 
 
+# Case-insensitive ForeignKey query (uses the lower(name) index on Author)
+def query_books_by_author_case_insensitive(author_name):
+    """
+    Query books by author name, ignoring case.
+    Comparing Lower('author__name') with a lowercased value lets the database
+    use the functional index on lower(name), which name__iexact would not.
+    """
+    books = Book.objects.alias(author_name_lower=Lower('author__name')).filter(
+        author_name_lower=author_name.lower()
+    )
+    return books
+
+
 # ManyToMany Relationship: List all books in a library
 def list_books_in_library(library_name):
     """
@@ -103,6 +120,58 @@ def get_librarian_for_library_alternative(library_name):
         return None
 
 
+# Batched variants: many names in a constant number of queries
+def query_books_by_authors(author_names):
+    """
+    Query the books of many authors in one joined query.
+
+    Args:
+        author_names (iterable of str): The names of the authors
+
+    Returns:
+        dict: {author name: list of books, with their author loaded}; [] for unknown names
+    """
+    books = {name: [] for name in author_names}
+    for book in Book.objects.with_author().filter(author__name__in=list(books)).order_by('title', 'pk'):
+        books[book.author.name].append(book)
+    return books
+
+
+def list_books_in_libraries(library_names):
+    """
+    List the books of many libraries: one query for the libraries, one for their books.
+
+    Args:
+        library_names (iterable of str): The names of the libraries
+
+    Returns:
+        dict: {library name: list of books, with their author loaded}; [] for unknown names
+    """
+    books = {name: [] for name in library_names}
+    libraries = Library.objects.filter(name__in=list(books)).prefetch_related(
+        Prefetch('books', queryset=Book.objects.with_author().order_by('title', 'pk'))
+    )
+    for library in libraries:
+        books[library.name].extend(library.books.all())
+    return books
+
+
+def get_librarians_for_libraries(library_names):
+    """
+    Retrieve the librarians of many libraries in one joined query.
+
+    Args:
+        library_names (iterable of str): The names of the libraries
+
+    Returns:
+        dict: {library name: Librarian or None}
+    """
+    librarians = dict.fromkeys(library_names)
+    for librarian in Librarian.objects.select_related('library').filter(library__name__in=list(librarians)):
+        librarians[librarian.library.name] = librarian
+    return librarians
+
+
 # Example usage functions (commented out to avoid execution errors if data doesn't exist)
 """
 # Example 1: Query all books by a specific author
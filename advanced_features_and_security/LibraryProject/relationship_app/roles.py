@@ -0,0 +1,56 @@
+"""
+Role lookups for the role-gated views (is_admin / is_librarian / is_member).
+A user without a UserProfile row (e.g. one inserted without signals) has the
+default role; reading the role never creates the row.
+
+The role is resolved at most once per request and memoized on the user object.
+When the user was loaded by CachingModelBackend its profile came in the same
+joined query, so no query is needed at all; otherwise the role is read from the
+shared cache, and only on a miss from the database. Cache entries are deleted
+by the UserProfile post_save/post_delete receivers in models.py, when the change
+commits (so a concurrent request cannot cache the old role again).
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+
+
+def role_cache_key(user_id):
+    return 'relationship_app:role:%s' % user_id
+
+
+def invalidate_role(user_id):
+    invalidate_roles([user_id])
+
+
+def invalidate_roles(user_ids):
+    """Delete the cached roles when the current transaction commits."""
+    keys = [role_cache_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _load_role(user):
+    try:
+        return user.profile.role
+    except ObjectDoesNotExist:
+        return user._meta.get_field('profile').related_model._meta.get_field('role').default
+
+
+def get_role(user):
+    """Return the user's UserProfile role, or None for anonymous users."""
+    if not user.is_authenticated:
+        return None
+    role = getattr(user, '_role_cache', None)
+    if role is None:
+        if user._meta.get_field('profile').is_cached(user):
+            role = _load_role(user)
+        else:
+            key = role_cache_key(user.pk)
+            role = cache.get(key)
+            if role is None:
+                role = _load_role(user)
+                cache.set(key, role, getattr(settings, 'ROLE_CACHE_TIMEOUT', 3600))
+        user._role_cache = role
+    return role
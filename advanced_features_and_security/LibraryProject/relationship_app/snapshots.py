@@ -0,0 +1,139 @@
+"""
+Materialized read models for the catalog pages (models CatalogEntry and LibrarySnapshot).
+
+- CatalogEntry: one flat row per book (title, author id/name/book count), written
+  by the Book/Author receivers in models.py as the catalog changes. list_books pages
+  over it with keyset pagination: one indexed query, no join.
+- LibrarySnapshot: one row per library with its whole book list as a compact JSON
+  array. Changes only mark the affected libraries stale (an UPDATE bumping `version`);
+  the snapshot is rebuilt by the next LibraryDetailView request or by
+  `manage.py rebuild_snapshots`. A rebuild that races with a change stays stale,
+  because it records the version it read before reading the books.
+
+Bulk writes send no signals: import_catalog calls add_entries(),
+refresh_entry_counts() and mark_stale() for the books, authors and libraries each
+batch touched. stale_stats() feeds the /metrics staleness gauges.
+"""
+
+import json
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from LibraryProject import routers
+
+BATCH_SIZE = 2000
+
+
+def _models():
+    from .models import Author, Book, CatalogEntry, Library, LibrarySnapshot
+    return Author, Book, CatalogEntry, Library, LibrarySnapshot
+
+
+def refresh_entry(book, using=None):
+    """Upsert `book`'s CatalogEntry with its current title and author."""
+    Author, _, CatalogEntry, _, _ = _models()
+    name, book_count = Author.objects.using(using).filter(pk=book.author_id).values_list('name', 'book_count').get()
+    CatalogEntry.objects.using(using).update_or_create(
+        book_id=book.pk,
+        defaults={
+            'title': book.title, 'author_id': book.author_id,
+            'author_name': name, 'author_book_count': book_count,
+        },
+    )
+
+
+def mark_stale(libraries, using=None):
+    """Mark the snapshots of `libraries` (ids or a Library queryset) stale."""
+    _, _, _, _, LibrarySnapshot = _models()
+    if not isinstance(libraries, (list, set, tuple)) or libraries:
+        LibrarySnapshot.objects.using(using).filter(library__in=libraries).update(
+            version=F('version') + 1, stale_since=Coalesce('stale_since', timezone.now()),
+        )
+
+
+def mark_all_stale(using=None):
+    _, _, _, _, LibrarySnapshot = _models()
+    LibrarySnapshot.objects.using(using).update(
+        version=F('version') + 1, stale_since=Coalesce('stale_since', timezone.now()),
+    )
+
+
+def build_library_snapshot(library_id):
+    """Rebuild one library's snapshot from the primary; returns it, or None if there is no such library."""
+    _, Book, _, Library, LibrarySnapshot = _models()
+    with routers.pin_to_primary():
+        library = Library.objects.filter(pk=library_id).values('name', 'book_count').first()
+        if library is None:
+            return None
+        snapshot, _ = LibrarySnapshot.objects.get_or_create(library_id=library_id)
+        version = snapshot.version
+        rows = Book.objects.filter(libraries=library_id).order_by('title', 'pk').values_list(
+            'pk', 'title', 'author_id', 'author__name'
+        )
+        built = {
+            'name': library['name'], 'book_count': library['book_count'],
+            'data': json.dumps(list(rows), separators=(',', ':')),
+            'built_version': version, 'built_at': timezone.now(),
+        }
+        # Clear stale_since only if nothing changed while building.
+        if not LibrarySnapshot.objects.filter(pk=library_id, version=version).update(stale_since=None, **built):
+            LibrarySnapshot.objects.filter(pk=library_id).update(**built)
+    for name, value in built.items():
+        setattr(snapshot, name, value)
+    if snapshot.version == version:
+        snapshot.stale_since = None
+    return snapshot
+
+
+def _entries(books, batch_size):
+    """Yield lists of unsaved CatalogEntry rows for the `books` queryset."""
+    _, _, CatalogEntry, _, _ = _models()
+    rows = books.order_by().values_list('pk', 'title', 'author_id', 'author__name', 'author__book_count')
+    batch = []
+    for book_id, title, author_id, author_name, book_count in rows.iterator(chunk_size=batch_size):
+        batch.append(CatalogEntry(
+            book_id=book_id, title=title, author_id=author_id,
+            author_name=author_name, author_book_count=book_count,
+        ))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    yield batch
+
+
+def rebuild_entries(batch_size=BATCH_SIZE):
+    """Rebuild every CatalogEntry from the catalog, in one transaction."""
+    _, Book, CatalogEntry, _, _ = _models()
+    with routers.pin_to_primary(), transaction.atomic():
+        CatalogEntry.objects.all().delete()
+        for batch in _entries(Book.objects.all(), batch_size):
+            CatalogEntry.objects.bulk_create(batch)
+
+
+def add_entries(book_ids, batch_size=BATCH_SIZE):
+    """Create the CatalogEntry rows of new books, e.g. after bulk_create."""
+    _, Book, CatalogEntry, _, _ = _models()
+    if book_ids:
+        for batch in _entries(Book.objects.filter(pk__in=book_ids), batch_size):
+            CatalogEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def refresh_entry_counts(authors=None):
+    """Copy Author.book_count into the entries of `authors` (ids; default all), e.g. after `manage.py recount`."""
+    Author, _, CatalogEntry, _, _ = _models()
+    entries = CatalogEntry.objects.all() if authors is None else CatalogEntry.objects.filter(author__in=authors)
+    entries.update(author_book_count=Subquery(
+        Author.objects.filter(pk=OuterRef('author_id')).values('book_count')
+    ))
+
+
+def stale_stats():
+    """(number of stale library snapshots, age in seconds of the oldest one)."""
+    _, _, _, _, LibrarySnapshot = _models()
+    stale = LibrarySnapshot.objects.filter(built_version__lt=F('version'))
+    oldest = stale.order_by('stale_since').values_list('stale_since', flat=True).first()
+    age = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return stale.count(), age
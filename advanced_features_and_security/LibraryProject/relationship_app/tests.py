@@ -1,3 +1,653 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import tempfile
+import time
+from unittest import mock
+import zlib
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import verify_password
+from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from LibraryProject import catalog_cache, changes, metrics, querycheck, routers
+from LibraryProject.hashers import TunedScryptPasswordHasher
+from LibraryProject.importer import import_catalog
+from LibraryProject.middleware import CompiledPolicy
+from LibraryProject.test_runner import QueryCheckRunner
+
+from . import lookups, query_samples, snapshots
+from .loaders import Loader, Loaders
+from .models import Author, Book, CatalogEntry, Library, Librarian, LibrarySnapshot, UserProfile
+from .roles import get_role
+
+
+class PasswordHashProfileTests(TestCase):
+    def test_scrypt_hash_above_profile_cost_is_verified_and_upgraded(self):
+        # A hash made under the 'scrypt' profile (N=2**17) needs more memory than the
+        # active profile's scrypt parameters would allow.
+        user = get_user_model().objects.create_user('reader', password='unused')
+        user.password = TunedScryptPasswordHasher().encode('secret', 'saltsaltsalt', n=2 ** 17, r=8, p=1)
+        user.save(update_fields=['password'])
+
+        self.assertEqual(authenticate(username='reader', password='secret'), user)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+    def test_scrypt_hash_above_configured_costs_is_refused(self):
+        hasher = TunedScryptPasswordHasher()
+        # N=2**20 would need 1 GiB; no configured profile allows it.
+        encoded = 'scrypt$%d$saltsaltsalt$8$1$%s' % (2 ** 20, 'A' * 88)
+        with mock.patch('hashlib.scrypt') as scrypt:
+            self.assertFalse(hasher.verify('secret', encoded))
+            self.assertFalse(hasher.verify('secret', 'scrypt$16384$saltsaltsalt$8$64$' + 'A' * 88))
+        scrypt.assert_not_called()
+        self.assertTrue(hasher.verify('secret', hasher.encode('secret', 'saltsaltsalt', n=2 ** 14, r=8, p=1)))
+
+
+class BookCountTests(TestCase):
+    def test_deleting_an_uncounted_book_keeps_counts_at_zero(self):
+        author = Author.objects.create(name='Author')
+        library = Library.objects.create(name='Library')
+        # bulk_create sends no signals, so neither count includes this book.
+        [book] = Book.objects.bulk_create([Book(title='Uncounted', author=author)])
+        library.books.through.objects.create(library=library, book=book)
+
+        book.delete()
+
+        author.refresh_from_db()
+        library.refresh_from_db()
+        self.assertEqual((author.book_count, library.book_count), (0, 0))
+
+
+# No cache: every request does all of its work, and permissions are loaded from the
+# database (once for the permission check, once for the page cache key).
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class CatalogQueryCountTests(TestCase):
+    """The catalog pages run a fixed number of queries however many books they show."""
+
+    # session, user, permissions twice, and the page's own query
+    QUERIES = 5
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.library = Library.objects.create(name='Library')
+
+    def add_books(self, n):
+        for i in range(n):
+            book = Book.objects.create(title='Book %d' % i, author=Author.objects.create(name='Author %d' % i))
+            self.library.books.add(book)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_books(self):
+        self.add_books(10)
+        with self.assertNumQueries(self.QUERIES):  # one page of CatalogEntry rows
+            self.client.get(reverse('relationship_app:list_books'), secure=True)
+        self.add_books(90)
+        with self.assertNumQueries(self.QUERIES):
+            self.client.get(reverse('relationship_app:list_books'), secure=True)
+
+    def test_library_detail(self):
+        url = reverse('relationship_app:library_detail', args=[self.library.pk])
+        self.count_queries(url)  # creates the snapshot
+        # Adding books marks the snapshot stale: the next request rebuilds it.
+        self.add_books(10)
+        rebuild_small = self.count_queries(url)
+        with self.assertNumQueries(self.QUERIES):  # the library's snapshot row
+            self.client.get(url, secure=True)
+        self.add_books(90)
+        self.assertEqual(self.count_queries(url), rebuild_small)
+        with self.assertNumQueries(self.QUERIES):
+            self.client.get(url, secure=True)
+
+
+class UserProfileWriteTests(TestCase):
+    def profile_writes(self, queries):
+        return [
+            q['sql'] for q in queries.captured_queries
+            if 'relationship_app_userprofile' in q['sql'] and not q['sql'].startswith('SELECT')
+        ]
+
+    def test_creating_a_user_inserts_one_profile(self):
+        with CaptureQueriesContext(connection) as queries:
+            user = get_user_model().objects.create_user('member', password='secret')
+        writes = self.profile_writes(queries)
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT'))
+        self.assertEqual(UserProfile.objects.get(user=user).role, 'Member')
+
+    def test_login_does_not_write_the_profile(self):
+        get_user_model().objects.create_user('member', password='secret')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('relationship_app:login'), {'username': 'member', 'password': 'secret'}, secure=True,
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.profile_writes(queries), [])
+
+    def test_save_after_refresh_writes_a_change_back(self):
+        user = get_user_model().objects.create_user('member', password='secret')
+        for refresh in (lambda p: p.refresh_from_db(), lambda p: async_to_sync(p.arefresh_from_db)()):
+            profile = UserProfile.objects.get(user=user)
+            # Another process changes the role...
+            UserProfile.objects.filter(pk=profile.pk).update(role='Librarian')
+            refresh(profile)
+            # ...and this one sets it back to the value it first loaded.
+            profile.role = 'Member'
+            profile.save()
+            self.assertEqual(UserProfile.objects.get(pk=profile.pk).role, 'Member')
+
+    def test_partial_refresh_keeps_other_changes(self):
+        user = get_user_model().objects.create_user('member', password='secret')
+        profile = UserProfile.objects.get(user=user)
+        profile.role = 'Admin'
+        profile.refresh_from_db(fields=['user'])
+        profile.save()
+        self.assertEqual(UserProfile.objects.get(pk=profile.pk).role, 'Admin')
+
+
+class DbStatsTests(TestCase):
+    def test_reports_sqlite_pragmas(self):
+        # The test database is in memory, where e.g. mmap_size returns no row.
+        self.client.force_login(get_user_model().objects.create_user('staff', password='pw', is_staff=True))
+        response = self.client.get(reverse('relationship_app:db_stats'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        if connection.vendor == 'sqlite':
+            self.assertEqual(response.json()['default']['pragmas'].keys(), settings.SQLITE_PRAGMAS.keys())
+
+
+class QueryCheckTests(TestCase):
+    def run_n_plus_one(self):
+        authors = [Author.objects.create(name='Author %d' % i) for i in range(5)]
+        querycheck.instrument_open_connections()
+        with querycheck.inspect_queries('test-n-plus-one') as inspection:
+            for author in authors:
+                list(Book.objects.filter(author=author))
+        offenders = inspection.offenders()
+        with self.assertLogs('LibraryProject.querycheck', 'WARNING') as logs:
+            querycheck.report(offenders)
+        self.assertIn('repeated query in test-n-plus-one', logs.output[0])
+        # Keep the test's own offender out of the gate applied to this run.
+        for offender in offenders:
+            self.addCleanup(querycheck.collected.pop, querycheck.offender_key(offender), None)
+        return offenders
+
+    def test_runner_reports_new_n_plus_one(self):
+        offenders = self.run_n_plus_one()
+        self.assertEqual([(offender.kind, offender.count) for offender in offenders], [('repeated', 5)])
+        key = querycheck.offender_key(offenders[0])
+        with override_settings(QUERY_BASELINE='/nonexistent/query_baseline.json'):
+            self.assertIn(key, QueryCheckRunner().new_offenders())
+
+    def test_runner_accepts_baselined_offender(self):
+        offenders = self.run_n_plus_one()
+        key = querycheck.offender_key(offenders[0])
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as baseline:
+            json.dump([key], baseline)
+            baseline.flush()
+            with override_settings(QUERY_BASELINE=baseline.name):
+                self.assertNotIn(key, QueryCheckRunner().new_offenders())
+
+
+    def test_runner_fails_on_new_offenders(self):
+        key = querycheck.offender_key(self.run_n_plus_one()[0])
+        with override_settings(QUERY_BASELINE='/nonexistent/query_baseline.json'), \
+                mock.patch.object(DiscoverRunner, 'suite_result', return_value=0), \
+                mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            failures = QueryCheckRunner().suite_result(None, None)
+        self.assertGreaterEqual(failures, 1)
+        self.assertIn('New repeated query offender %s' % key, stderr.getvalue())
+
+    def test_runner_updates_the_baseline(self):
+        key = querycheck.offender_key(self.run_n_plus_one()[0])
+        with tempfile.TemporaryDirectory() as directory:
+            path = '%s/query_baseline.json' % directory
+            with override_settings(QUERY_BASELINE=path), \
+                    mock.patch.object(DiscoverRunner, 'suite_result', return_value=0):
+                self.assertEqual(QueryCheckRunner(update_query_baseline=True).suite_result(None, None), 0)
+                self.assertNotIn(key, QueryCheckRunner().new_offenders())
+            with open(path) as f:
+                self.assertIn(key, json.load(f))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user('staff', password='pw', is_staff=True)
+
+    def test_execute_wrapper_counts_queries_of_measured_requests(self):
+        metrics.instrument_open_connections()
+        request_metrics, token = metrics.start()
+        try:
+            list(Author.objects.all())
+            list(Book.objects.all())
+        finally:
+            metrics.finish(token)
+        list(Author.objects.all())
+        self.assertEqual(request_metrics.queries, 2)
+        self.assertGreater(request_metrics.db_time, 0)
+
+    def test_requests_are_aggregated_per_view(self):
+        before = metrics._aggregates.get('relationship_app:list_books', {}).get('count', 0)
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.client.get(reverse('relationship_app:list_books'), secure=True)
+        self.assertEqual(metrics._aggregates['relationship_app:list_books']['count'], before + 1)
+
+        observed = metrics.RequestMetrics()
+        observed.queries = 3
+        metrics.observe('test-histogram', observed, 0.03)
+        lines = metrics.render_prometheus().splitlines()
+        for line in (
+            'django_request_duration_seconds_bucket{view="test-histogram",le="0.025"} 0',
+            'django_request_duration_seconds_bucket{view="test-histogram",le="0.05"} 1',
+            'django_request_duration_seconds_bucket{view="test-histogram",le="+Inf"} 1',
+            'django_request_duration_seconds_count{view="test-histogram"} 1',
+            'django_request_db_queries_total{view="test-histogram"} 3',
+        ):
+            self.assertIn(line, lines)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_metrics_are_staff_only_without_a_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, secure=True).status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user('member', password='pw'))
+        self.assertEqual(self.client.get(url, secure=True).status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(url, secure=True).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_require_the_token_when_set(self):
+        url = reverse('metrics')
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(url, secure=True).status_code, 403)
+        self.assertEqual(self.client.get(url, secure=True, headers={'authorization': 'Bearer wrong'}).status_code, 403)
+        response = self.client.get(url, secure=True, headers={'authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE django_request_duration_seconds histogram', response.content.decode())
+
+
+class ContentSecurityPolicyTests(TestCase):
+    @override_settings(CSP_DEFAULT_SRC=("'self'",))
+    def test_nonce_without_script_and_style_src(self):
+        del settings.CSP_SCRIPT_SRC, settings.CSP_STYLE_SRC
+        policy = CompiledPolicy()
+        self.assertNotIn('script-src', policy.header)
+        directives = dict(directive.split(' ', 1) for directive in policy.with_nonce('abc').split('; '))
+        self.assertEqual(directives['default-src'], "'self'")
+        self.assertEqual(directives['script-src'], "'self' 'nonce-abc'")
+        self.assertEqual(directives['style-src'], "'self' 'nonce-abc'")
+
+
+class CommitInvalidationTests(TestCase):
+    """Caches are invalidated when the change commits, not while it is uncommitted."""
+
+    def test_catalog_scope_bumped_on_commit(self):
+        versions = async_to_sync(catalog_cache.aversions)
+        before = versions(['relationship_app:books'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Author.objects.create(name='Author')
+            self.assertEqual(versions(['relationship_app:books']), before)
+        self.assertGreater(versions(['relationship_app:books']), before)
+
+    def test_change_time_recorded_on_commit(self):
+        before = changes.last_changed([Author])
+        with self.captureOnCommitCallbacks(execute=True):
+            Author.objects.create(name='Author')
+            self.assertEqual(changes.last_changed([Author]), before)
+        self.assertGreater(changes.last_changed([Author])['relationship_app.author'], before['relationship_app.author'])
+
+    def test_permissions_invalidated_on_commit(self):
+        user = get_user_model().objects.create_user('reader', password='pw')
+        group = Group.objects.create(name='Readers')
+        user.groups.add(group)
+        self.assertFalse(get_user_model().objects.get(pk=user.pk).has_perm('relationship_app.can_view'))
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.add(Permission.objects.get(codename='can_view', content_type__app_label='relationship_app'))
+            # A request running before the commit still reads the old permission set.
+            self.assertFalse(get_user_model().objects.get(pk=user.pk).has_perm('relationship_app.can_view'))
+        self.assertTrue(get_user_model().objects.get(pk=user.pk).has_perm('relationship_app.can_view'))
+
+    def test_role_invalidated_on_commit(self):
+        user = get_user_model().objects.create_user('member', password='pw')
+        self.assertEqual(get_role(get_user_model().objects.get(pk=user.pk)), 'Member')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.get(user=user)
+            profile.role = 'Librarian'
+            profile.save()
+            self.assertEqual(get_role(get_user_model().objects.get(pk=user.pk)), 'Member')
+        self.assertEqual(get_role(get_user_model().objects.get(pk=user.pk)), 'Librarian')
+
+    def test_names_forgotten_on_commit(self):
+        author = Author.objects.create(name='Old Name')
+        Book.objects.create(title='Book', author=author)
+        self.assertEqual(len(lookups.books_by_author('Old Name')), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            author.name = 'New Name'
+            author.save()
+            self.assertEqual(len(lookups.books_by_author('Old Name')), 1)
+        self.assertEqual(len(lookups.books_by_author('Old Name')), 0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(TestCase):
+    async def test_page_cache_misses_read_from_the_primary(self):
+        databases = []
+
+        @catalog_cache.cached_catalog_page('routing', lambda request: ['routing'])
+        async def view(request):
+            databases.append(routers.ReplicaRouter().db_for_read(Book))
+            return HttpResponse('page')
+
+        request = RequestFactory().get('/routing/')
+        request.auser = mock.AsyncMock(return_value=AnonymousUser())
+        with routers.request_routing() as state:
+            await view(request)
+            catalog_cache._bump(['routing'])
+            await view(request)
+            await view(request)  # A hit: the view does not run.
+            self.assertEqual(routers.ReplicaRouter().db_for_read(Book), 'replica1')
+        self.assertEqual(databases, ['default', 'default'])
+        self.assertFalse(state['pinned'])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.url = reverse('relationship_app:list_books')
+
+    async def test_async_view_reads_change_times_without_blocking(self):
+        await self.async_client.aforce_login(await get_user_model().objects.aget(username='admin'))
+        with mock.patch.object(changes, 'last_changed', side_effect=AssertionError('sync cache read')):
+            response = await self.async_client.get(self.url, secure=True)
+            self.assertEqual(response.status_code, 200)
+            response = await self.async_client.get(self.url, secure=True, headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_last_modified_waits_for_the_second_to_pass(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Author.objects.create(name='Author')
+        self.assertNotIn('Last-Modified', self.client.get(self.url, secure=True))
+        with mock.patch('time.time', return_value=time.time() + 1):
+            response = self.client.get(self.url, secure=True)
+            self.assertIn('Last-Modified', response)
+            response = self.client.get(self.url, secure=True, headers={'if-modified-since': response['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+
+class ImportCatalogTests(TestCase):
+    def test_import_refreshes_only_what_it_touched(self):
+        austen = Author.objects.create(name='Jane Austen')
+        emma = Book.objects.create(title='Emma', author=austen)
+        touched, untouched = Library.objects.create(name='Touched'), Library.objects.create(name='Untouched')
+        untouched.books.add(emma)
+        for library in (touched, untouched):
+            snapshots.build_library_snapshot(library.pk)
+        rows = [
+            {'title': 'Persuasion', 'author': 'Jane Austen', 'libraries': ['Touched']},
+            {'title': 'Emma', 'author': 'Jane Austen', 'libraries': ['Touched', 'Untouched']},
+        ]
+        with mock.patch.object(snapshots, 'rebuild_entries') as rebuild, \
+                mock.patch.object(snapshots, 'mark_all_stale') as mark_all_stale:
+            stats = import_catalog('relationship_app', rows)
+        rebuild.assert_not_called()
+        mark_all_stale.assert_not_called()
+        self.assertEqual((stats.created, stats.skipped), (1, 0))
+        self.assertEqual(
+            sorted(CatalogEntry.objects.values_list('title', 'author_book_count')), [('Emma', 2), ('Persuasion', 2)],
+        )
+        self.assertEqual(Library.objects.get(pk=touched.pk).book_count, 2)
+        self.assertTrue(LibrarySnapshot.objects.get(pk=touched.pk).stale_since)
+        self.assertIsNone(LibrarySnapshot.objects.get(pk=untouched.pk).stale_since)
+
+
+@override_settings(API_MAX_PAGE_SIZE=10)
+class ApiTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        austen = Author.objects.create(name='Jane Austen')
+        self.emma = Book.objects.create(title='Emma', author=austen)
+        Book.objects.create(title='Persuasion', author=austen)
+        Library.objects.create(name='Central').books.add(self.emma)
+
+    def get(self, resource, **params):
+        return self.client.get(reverse('api', args=[resource]), params, secure=True)
+
+    def test_sparse_fieldsets(self):
+        response = self.get('books', fields='title,author.name')
+        self.assertEqual(response.json()['results'], [
+            {'title': 'Emma', 'author': {'name': 'Jane Austen'}},
+            {'title': 'Persuasion', 'author': {'name': 'Jane Austen'}},
+        ])
+        self.assertEqual(self.get('books', fields='title,isbn').status_code, 400)
+
+    def test_includes_cost_one_query(self):
+        with CaptureQueriesContext(connection) as plain:
+            self.get('books', fields='id')
+        with CaptureQueriesContext(connection) as included:
+            response = self.get('books', fields='id', include='libraries')
+        self.assertEqual(len(included), len(plain) + 1)
+        self.assertEqual(response.json()['results'][0]['libraries'], [
+            {'id': Library.objects.get().pk, 'name': 'Central'},
+        ])
+        self.assertEqual(response.json()['results'][1]['libraries'], [])
+        self.assertEqual(self.get('books', include='reviews').status_code, 400)
+
+    def test_cursor_pagination_and_limits(self):
+        first = self.get('books', fields='title', limit=1).json()
+        self.assertEqual(first['results'], [{'title': 'Emma'}])
+        second = self.get('books', fields='title', limit=1, cursor=first['next_cursor']).json()
+        self.assertEqual(second, {'results': [{'title': 'Persuasion'}], 'next_cursor': None})
+        self.assertEqual(self.get('books', cursor='not-a-cursor').status_code, 400)
+        self.assertEqual(self.get('books', limit=11).status_code, 400)
+        self.assertEqual(self.get('books', limit=10).status_code, 200)
+
+    def test_if_none_match_gets_304_until_a_change(self):
+        etag = self.get('books')['ETag']
+        url = reverse('api', args=['books'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, secure=True, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in queries if 'catalogentry' in q['sql']])
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(title='Sanditon', author=self.emma.author)
+        self.assertEqual(self.client.get(url, secure=True, headers={'if-none-match': etag}).status_code, 200)
+
+    def test_permission_and_unknown_resource(self):
+        self.client.force_login(get_user_model().objects.create_user('reader', password='pw'))
+        self.assertEqual(self.get('books').status_code, 403)
+        self.assertEqual(self.get('reviews').status_code, 404)
+
+
+class NameLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        lookups._local.clear()
+        lookups._stats.clear()
+
+    def test_lru_expires_and_evicts(self):
+        lru = lookups.LRUCache(maxsize=2, ttl=60)
+        with mock.patch('time.monotonic', return_value=1000):
+            lru.set('a', 1)
+            lru.set('b', 2)
+            self.assertEqual(lru.get('a'), 1)  # 'b' is now the least recently used
+            lru.set('c', 3)
+            self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+        with mock.patch('time.monotonic', return_value=1061):
+            self.assertIsNone(lru.get('a'))
+
+    def test_rename_and_delete_retire_shared_entries_on_commit(self):
+        author = Author.objects.create(name='Old Name')
+        library = Library.objects.create(name='Branch')
+        lookups.remember_pk(Author, 'Old Name', author.pk)
+        lookups.remember_pk(Library, 'Branch', library.pk)
+        lookups._local.clear()  # As seen from another process.
+        with self.captureOnCommitCallbacks(execute=True):
+            author.name = 'New Name'
+            author.save()
+            library.delete()
+            self.assertEqual(lookups.cached_pk(Author, 'Old Name'), author.pk)
+            lookups._local.clear()
+        self.assertIsNone(lookups.cached_pk(Author, 'Old Name'))
+        self.assertIsNone(lookups.cached_pk(Library, 'Branch'))
+
+    def test_stats_count_local_and_shared_hits(self):
+        Book.objects.create(title='Emma', author=Author.objects.create(name='Jane Austen'))
+        lookups.books_by_author('Jane Austen')  # miss
+        lookups.books_by_author('Jane Austen')  # local hit
+        lookups._local.clear()
+        lookups.books_by_author('Jane Austen')  # shared hit
+        self.assertEqual(lookups.stats(), {'local_hits': 1, 'shared_hits': 1, 'misses': 1, 'hit_ratio': 2 / 3})
+
+    def test_library_without_librarian_is_remembered(self):
+        library = Library.objects.create(name='Branch')
+        self.assertIsNone(lookups.librarian_for_library('Branch'))
+        self.assertEqual(lookups.cached_pk(Library, 'Branch'), library.pk)
+        with self.assertNumQueries(1):
+            self.assertIsNone(lookups.librarian_for_library('Branch'))
+
+
+class LoaderTests(TestCase):
+    def setUp(self):
+        austen, tolkien = Author.objects.create(name='Jane Austen'), Author.objects.create(name='J. R. R. Tolkien')
+        central, branch = Library.objects.create(name='Central'), Library.objects.create(name='Branch')
+        for title, author in (('Emma', austen), ('Persuasion', austen), ('The Hobbit', tolkien)):
+            central.books.add(Book.objects.create(title=title, author=author))
+        branch.books.add(Book.objects.get(title='Emma'))
+        Librarian.objects.create(name='Ann', library=central)
+
+    def test_loads_are_batched(self):
+        loaders = Loaders()
+        pending = {name: loaders.books_by_author.load(name) for name in ('Jane Austen', 'J. R. R. Tolkien', 'Nobody')}
+        with self.assertNumQueries(1):
+            titles = {name: [(book.title, book.author.name) for book in books] for name, books in pending.items()}
+        self.assertEqual(titles, {
+            'Jane Austen': [('Emma', 'Jane Austen'), ('Persuasion', 'Jane Austen')],
+            'J. R. R. Tolkien': [('The Hobbit', 'J. R. R. Tolkien')],
+            'Nobody': [],
+        })
+        with self.assertNumQueries(0):
+            self.assertEqual(len(loaders.books_by_author.load('Jane Austen')), 2)
+
+    def test_concurrent_aloads_share_one_query(self):
+        loaders = Loaders()
+
+        async def load_all():
+            return await asyncio.gather(*(loaders.librarian.aload(name) for name in ('Central', 'Branch', 'Nowhere')))
+
+        with self.assertNumQueries(1):
+            central, branch, nowhere = async_to_sync(load_all)()
+        self.assertEqual((central.name, branch, nowhere), ('Ann', None, None))
+
+    async def test_key_loaded_during_a_batch_gets_the_next_one(self):
+        calls = []
+
+        def batch(keys):
+            calls.append(keys)
+            return {key: key.upper() for key in keys}
+
+        loader = Loader(batch)
+
+        async def late(key):
+            while not calls:  # The first batch has taken its keys and is loading.
+                await asyncio.sleep(0)
+            return await loader.aload(key)
+
+        self.assertEqual(await asyncio.gather(loader.aload('a'), late('b'), loader.aload('c')), ['A', 'B', 'C'])
+        self.assertEqual(calls, [['a', 'c'], ['b']])
+
+    def test_batched_query_samples(self):
+        with self.assertNumQueries(1):
+            books = query_samples.query_books_by_authors(['Jane Austen', 'Nobody'])
+            self.assertEqual([book.author.name for book in books['Jane Austen']], ['Jane Austen'] * 2)
+        self.assertEqual(books['Nobody'], [])
+        with self.assertNumQueries(2):
+            books = query_samples.list_books_in_libraries(['Central', 'Branch', 'Nowhere'])
+            self.assertEqual([(book.title, book.author.name) for book in books['Branch']], [('Emma', 'Jane Austen')])
+        self.assertEqual(len(books['Central']), 3)
+        self.assertEqual(books['Nowhere'], [])
+        with self.assertNumQueries(1):
+            librarians = query_samples.get_librarians_for_libraries(['Central', 'Branch'])
+            self.assertEqual(librarians['Central'].library.name, 'Central')
+        self.assertIsNone(librarians['Branch'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        austen = Author.objects.create(name='Jane Austen')
+        self.emma = Book.objects.create(title='Emma', author=austen)
+        self.persuasion = Book.objects.create(title='Persuasion', author=austen)
+        Library.objects.create(name='Central').books.add(self.emma)
+        Library.objects.create(name='Branch').books.add(self.emma)
+
+    def test_gzip_csv_export(self):
+        response = self.client.get(reverse('relationship_app:export_books'), {'compress': 'gzip'}, secure=True)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="relationship_app.csv.gz"')
+        text = zlib.decompress(b''.join(response.streaming_content), 31).decode()
+        rows = list(csv.reader(io.StringIO(text)))
+        self.assertEqual(rows[0], ['id', 'title', 'author_id', 'author', 'libraries'])
+        author_id = str(self.emma.author_id)
+        self.assertEqual(sorted(rows[1][4].split('|')), ['Branch', 'Central'])
+        self.assertEqual([row[:4] for row in rows[1:]], [
+            [str(self.emma.pk), 'Emma', author_id, 'Jane Austen'],
+            [str(self.persuasion.pk), 'Persuasion', author_id, 'Jane Austen'],
+        ])
+        self.assertEqual(rows[2][4], '')
+
+    def test_invalid_options_are_rejected(self):
+        response = self.client.get(reverse('relationship_app:export_books'), {'format': 'xml'}, secure=True)
+        self.assertEqual(response.status_code, 400)
+
+
+class AsyncLoginTests(TestCase):
+    def setUp(self):
+        get_user_model().objects.create_user('member', password='secret')
+
+    async def test_login_hashes_off_the_event_loop(self):
+        on_event_loop = []
+
+        def verify(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                on_event_loop.append(True)
+            except RuntimeError:
+                on_event_loop.append(False)
+            return verify_password(*args, **kwargs)
+
+        with mock.patch('relationship_app.backends.verify_password', verify):
+            response = await self.async_client.post(
+                reverse('relationship_app:login'),
+                {'username': 'member', 'password': 'secret', 'next': '/books/'}, secure=True,
+            )
+        self.assertEqual((response.status_code, response.url), (302, '/books/'))
+        self.assertEqual(on_event_loop, [False])
+        self.assertEqual((await response.asgi_request.auser()).username, 'member')
+
+    async def test_wrong_password_shows_the_form_again(self):
+        response = await self.async_client.post(
+            reverse('relationship_app:login'), {'username': 'member', 'password': 'wrong'}, secure=True,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].non_field_errors())
+
+    def test_unsafe_next_is_ignored(self):
+        response = self.client.post(
+            reverse('relationship_app:login'),
+            {'username': 'member', 'password': 'secret', 'next': 'https://evil.example/'}, secure=True,
+        )
+        self.assertEqual(response.url, settings.LOGIN_REDIRECT_URL)
@@ -11,9 +11,18 @@ urlpatterns = [
     
     # Class-based view: Library detail view
     path('library/<int:pk>/', LibraryDetailView.as_view(), name='library_detail'),
+
+    # Catalog page cache hit/miss counters (staff only)
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
+
+    # Database connection / pool stats (staff only)
+    path('db-stats/', views.db_stats, name='db_stats'),
+
+    # Streaming catalog export
+    path('books/export/', views.export_books, name='export_books'),
     
     # Authentication views
-    path('login/', auth_views.LoginView.as_view(template_name='relationship_app/login.html'), name='login'),
+    path('login/', views.login_view, name='login'),
     path('logout/', auth_views.LogoutView.as_view(template_name='relationship_app/logout.html'), name='logout'),
     path('register/', views.register, name='register'),
     
@@ -1,38 +1,118 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, resolve_url
+from django.conf import settings
+from django.contrib.auth import aauthenticate, alogin, login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.decorators import permission_required
-from django.contrib.auth.mixins import PermissionRequiredMixin
-from django.views.generic.detail import DetailView
-from .models import Book, Library, Author
-from .forms import BookForm
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.decorators import method_decorator
+from django.views import View
+from LibraryProject import catalog_cache, db
+from LibraryProject.changes import conditional
+from LibraryProject.catalog_cache import cached_catalog_page
+from LibraryProject.export import export_response
+from LibraryProject.pagination import apaginate
+from . import snapshots
+from .models import Book, CatalogEntry, Library, LibrarySnapshot, Author
+from .forms import BookForm, LoginForm
+from .roles import get_role
 
 # Permission names (from relationship_app.Book Meta): can_view, can_create, can_edit, can_delete.
 # Groups: Viewers (can_view), Editors (can_view, can_create, can_edit), Admins (all four).
 
+# Read views are async: under ASGI they use the async ORM directly instead of a
+# thread hop per request. Data is fully loaded before render(), which then does no I/O.
+# They render with the lean 'catalog' template engine (no auth/messages context).
+
 # Function-based view: List all books (requires can_view permission)
 @permission_required('relationship_app.can_view', raise_exception=True)
-def list_books(request):
+@conditional('list_books', [Book, Author])
+@cached_catalog_page('list_books', lambda request: ['relationship_app:books'])
+async def list_books(request):
     """
     Function-based view that lists all books stored in the database.
     Displays book titles and their authors. Requires can_view permission.
+    Reads the flat CatalogEntry read model (snapshots.py), keyset-paginated by
+    (title, pk) via ?cursor=, so each page is one indexed query with no join.
+    Rendered pages are cached until a Book or Author changes (see catalog_cache.py),
+    and a client holding the current page gets a 304 (see changes.py).
     """
-    books = Book.objects.all()
-    return render(request, 'relationship_app/list_books.html', {'books': books})
+    page = await apaginate(request, CatalogEntry.objects.all())
+    return render(request, 'relationship_app/list_books.html', {'books': page, 'page': page}, using='catalog')
 
 
 # Class-based view: Display library details (requires can_view permission)
-class LibraryDetailView(PermissionRequiredMixin, DetailView):
+@method_decorator(permission_required('relationship_app.can_view', raise_exception=True), name='get')
+@method_decorator(conditional('library_detail', [Library, Book, Author]), name='get')
+@method_decorator(cached_catalog_page(
+    'library_detail', lambda request, pk: ['relationship_app:books', 'relationship_app:library:%s' % pk],
+), name='get')
+class LibraryDetailView(View):
     """
-    Class-based view using DetailView to display details for a specific library.
-    Requires can_view permission.
+    Async class-based view that displays details for a specific library.
+    Requires can_view permission. Served from the library's LibrarySnapshot (one row
+    holding the whole book list), rebuilt first if a change marked it stale.
+    Rendered pages are cached until this library, its book list, or any Book or Author changes;
+    revalidations are answered with 304 while no Library, Book or Author changed.
     """
-    model = Library
     template_name = 'relationship_app/library_detail.html'
     context_object_name = 'library'
-    permission_required = 'relationship_app.can_view'
-    raise_exception = True
+
+    async def get(self, request, pk):
+        snapshot = await LibrarySnapshot.objects.filter(pk=pk).afirst()
+        if snapshot is None or snapshot.is_stale:
+            snapshot = await sync_to_async(snapshots.build_library_snapshot)(pk)
+            if snapshot is None:
+                raise Http404('No library found matching the query.')
+        return render(request, self.template_name, {
+            'object': snapshot, self.context_object_name: snapshot, 'books': snapshot.books,
+        }, using='catalog')
+
+
+# Catalog page cache monitoring (staff only)
+@staff_member_required
+def cache_stats(request):
+    """Per-view hit/miss counters of the catalog page cache in this process, as JSON."""
+    return JsonResponse(catalog_cache.stats())
+
+
+# Database connection monitoring (staff only)
+@staff_member_required
+def db_stats(request):
+    """Connection handling per database alias, with pool counters or SQLite PRAGMAs, as JSON."""
+    return JsonResponse(db.stats())
+
+
+# Catalog export (requires can_view permission)
+@permission_required('relationship_app.can_view', raise_exception=True)
+def export_books(request):
+    """
+    Stream every book with its author and libraries as CSV or JSONL (?format=csv|jsonl),
+    optionally gzip-compressed (?compress=gzip). Memory stays constant with catalog size.
+    """
+    return export_response(request, 'relationship_app')
+
+
+# Login view: async, so that under ASGI the password is hashed in a worker thread by
+# CachingModelBackend.aauthenticate while the event loop keeps serving other requests.
+async def login_view(request):
+    """Log in with username and password, then redirect to ?next= (if safe) or LOGIN_REDIRECT_URL."""
+    form = LoginForm(request, data=request.POST if request.method == 'POST' else None)
+    if form.is_valid():
+        user = await aauthenticate(
+            request, username=form.cleaned_data['username'], password=form.cleaned_data['password'],
+        )
+        if user is not None:
+            await alogin(request, user)
+            next_url = request.POST.get('next') or request.GET.get('next')
+            if not url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+                next_url = resolve_url(settings.LOGIN_REDIRECT_URL)
+            return redirect(next_url)
+        form.add_error(None, form.get_invalid_login_error())
+    return render(request, 'relationship_app/login.html', {'form': form}, using='catalog')
 
 
 # User registration view
@@ -51,20 +131,20 @@ def register(request):
     return render(request, 'relationship_app/register.html', {'form': form})
 
 
-# Role checking functions
+# Role checking functions. The role is looked up once per request and cached (see roles.py).
 def is_admin(user):
     """Check if user has Admin role."""
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'Admin'
+    return get_role(user) == 'Admin'
 
 
 def is_librarian(user):
     """Check if user has Librarian role."""
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'Librarian'
+    return get_role(user) == 'Librarian'
 
 
 def is_member(user):
     """Check if user has Member role."""
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'Member'
+    return get_role(user) == 'Member'
 
 
 # Role-based views